@@ -1 +0,0 @@
-# This file makes the root directory a Python package
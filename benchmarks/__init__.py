@@ -0,0 +1,5 @@
+"""
+解析・永続化・プレビュー・CSV出力の性能計測
+
+    python -m benchmarks.run --sizes 1000,10000 --schema IFC4
+"""
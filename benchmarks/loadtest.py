@@ -0,0 +1,152 @@
+"""
+起動中のサーバーに対するプレビュー・CSVダウンロードの負荷試験
+
+ログインしたセッションで、要素APIのページ取得（並べ替え・絞り込みを含む）と
+CSVダウンロードを指定した並列数で繰り返し、スループットと応答時間を表示する。
+
+    gunicorn -c gunicorn.conf.py main:app
+    python -m benchmarks.loadtest --url http://localhost:5000 \\
+        --email user@example.com --password secret --upload-id 1 \\
+        --concurrency 16 --duration 30
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import http.cookiejar
+import urllib.parse
+import urllib.request
+from urllib.error import HTTPError, URLError
+
+SORTS = (None, 'weight', '-weight', 'name', '-length')
+FILTERS = (None, None, None, 'H-', 'Beam')
+
+
+def login(base_url, email, password):
+    """ログインしてセッションのCookieを持つCookieJarを返す"""
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    with opener.open(f"{base_url}/auth/login") as response:
+        page = response.read().decode('utf-8')
+    match = re.search(r'name="csrf_token"[^>]*value="([^"]+)"', page)
+    data = {'email': email, 'password': password}
+    if match:
+        data['csrf_token'] = match.group(1)
+    with opener.open(f"{base_url}/auth/login", urllib.parse.urlencode(data).encode()) as response:
+        if '/auth/login' in response.geturl():
+            raise SystemExit("ログインに失敗しました（メールアドレスとパスワードを確認してください）")
+    return jar
+
+
+def _preview_url(base_url, upload_id, total):
+    params = {'offset': random.randrange(0, max(total, 1), 100) if total else 0, 'limit': 100}
+    sort = random.choice(SORTS)
+    if sort:
+        params['sort'] = sort
+    filter_text = random.choice(FILTERS)
+    if filter_text:
+        params['filter'] = filter_text
+    return f"{base_url}/ifc/api/uploads/{upload_id}/elements?{urllib.parse.urlencode(params)}"
+
+
+class _Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.bytes = {}
+        self.errors = {}
+
+    def record(self, kind, seconds, size, error=None):
+        with self.lock:
+            if error is not None:
+                self.errors.setdefault(kind, []).append(error)
+                return
+            self.latencies.setdefault(kind, []).append(seconds)
+            self.bytes[kind] = self.bytes.get(kind, 0) + size
+
+
+def _worker(base_url, jar, upload_id, total, download_ratio, deadline, stats):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    while time.monotonic() < deadline:
+        if random.random() < download_ratio:
+            kind, url = 'csv', f"{base_url}/ifc/download/{upload_id}"
+        else:
+            kind, url = 'preview', _preview_url(base_url, upload_id, total)
+        request = urllib.request.Request(url, headers={'Accept-Encoding': 'gzip'})
+        started = time.perf_counter()
+        try:
+            size = 0
+            with opener.open(request, timeout=120) as response:
+                while True:
+                    chunk = response.read(64 * 1024)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+            stats.record(kind, time.perf_counter() - started, size)
+        except (HTTPError, URLError, OSError) as e:
+            stats.record(kind, time.perf_counter() - started, 0, error=str(e))
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='プレビュー・CSVダウンロードの負荷試験')
+    parser.add_argument('--url', default='http://localhost:5000', help='サーバーのURL')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--upload-id', type=int, required=True, help='対象のアップロード履歴ID')
+    parser.add_argument('--concurrency', type=int, default=8, help='同時に送信するリクエスト数')
+    parser.add_argument('--duration', type=float, default=30, help='試験時間（秒）')
+    parser.add_argument('--download-ratio', type=float, default=0.1,
+                        help='リクエストのうちCSVダウンロードの割合（既定: 0.1）')
+    args = parser.parse_args(argv)
+
+    base_url = args.url.rstrip('/')
+    jar = login(base_url, args.email, args.password)
+
+    # ページ範囲を決めるため件数を取得する
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    with opener.open(f"{base_url}/ifc/api/uploads/{args.upload_id}/elements?limit=1") as response:
+        total = json.load(response)['total']
+
+    stats = _Stats()
+    deadline = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=_worker, daemon=True,
+                         args=(base_url, jar, args.upload_id, total, args.download_ratio, deadline, stats))
+        for _ in range(args.concurrency)
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    print(f"{base_url} 履歴 #{args.upload_id}（{total} 要素）並列数 {args.concurrency}、{elapsed:.1f} 秒")
+    print(f"  {'request':<8} {'count':>7} {'req/s':>8} {'MB/s':>8} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'errors':>7}")
+    failed = 0
+    for kind in ('preview', 'csv'):
+        latencies = stats.latencies.get(kind, [])
+        errors = stats.errors.get(kind, [])
+        failed += len(errors)
+        if not latencies:
+            print(f"  {kind:<8} {0:>7} {'-':>8} {'-':>8} {'-':>8} {'-':>8} {'-':>8} {len(errors):>7}")
+            continue
+        print(f"  {kind:<8} {len(latencies):>7} {len(latencies) / elapsed:>8.1f} "
+              f"{stats.bytes[kind] / elapsed / (1024 * 1024):>8.2f} "
+              f"{_percentile(latencies, 0.5) * 1000:>8.0f} {_percentile(latencies, 0.95) * 1000:>8.0f} "
+              f"{_percentile(latencies, 0.99) * 1000:>8.0f} {len(errors):>7}")
+    for kind, errors in stats.errors.items():
+        print(f"  {kind} のエラー例: {errors[0]}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
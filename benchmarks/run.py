@@ -0,0 +1,234 @@
+"""
+IFC CONVERTERの性能計測
+
+合成モデルを規模ごとに生成し、以下の段階の処理時間・スループット・
+最大RSSを計測する。規模ごとに別プロセスで実行するため、最大RSSは
+その規模の処理だけを反映する。
+
+    parse    ifc_app.utils.ifc_parser.process_ifc_file
+    persist  解析結果の保存（UploadHistoryとElementの一括挿入）
+    preview  プレビュー画面と要素APIの先頭・末尾ページ（並べ替えあり）
+    csv      CSVダウンロード（ストリーミング）
+
+    python -m benchmarks.run --sizes 1000,10000,100000
+    python -m benchmarks.run --sizes 1000,10000 --save-baseline
+
+比較の基準値（benchmarks/baseline.json）は計測する環境ごとに異なるため、リポジトリには含めない。
+比較に使う環境（CIのランナーなど）で、変更前のコードに対して --save-baseline を付けて一度実行し、
+作成しておく（既存のファイルには計測した規模・スキーマの結果だけを追加・上書きする）。
+基準値がない場合は計測結果の表示だけを行う。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_TOLERANCE = 0.25
+
+
+def _peak_rss_mb():
+    # Linuxではru_maxrssはKB単位
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class _Stage:
+    """処理時間と最大RSSの増加量を計測するコンテキストマネージャ"""
+
+    def __init__(self, results, name, count):
+        self.results = results
+        self.name = name
+        self.count = count
+
+    def __enter__(self):
+        self.start_rss = _peak_rss_mb()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self.results[self.name] = {
+            'seconds': round(elapsed, 4),
+            'per_sec': round(self.count / elapsed, 1) if elapsed > 0 else None,
+            'peak_rss_mb': round(_peak_rss_mb(), 1),
+            'rss_growth_mb': round(_peak_rss_mb() - self.start_rss, 1),
+        }
+        return False
+
+
+def run_scale(size, schema, workdir):
+    """1つの規模について全段階を計測する（子プロセスで実行）"""
+    from benchmarks.synthetic import write_model
+
+    model_path = os.path.join(workdir, f"model_{schema}_{size}.ifc")
+    started = time.perf_counter()
+    write_model(size, model_path, schema=schema)
+    generate_seconds = time.perf_counter() - started
+
+    # 生成時のメモリを計測に含めないよう、アプリの読み込みは生成後に行う
+    from ifc_app import create_app, db
+    from ifc_app.db import init_db
+    from ifc_app.models import User
+    from ifc_app.results import record_upload
+    from ifc_app.utils.ifc_parser import process_ifc_file
+    from config import Config
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(workdir, f'bench_{schema}_{size}.db')}"
+        UPLOAD_FOLDER = workdir
+        # 計測値・解析結果キャッシュ・列指向の解析結果はインスタンスディレクトリではなく作業ディレクトリに作る
+        METRICS_DIR = os.path.join(workdir, 'metrics')
+        PARSE_CACHE_DIR = os.path.join(workdir, 'parse_cache')
+        RESULT_DATA_DIR = os.path.join(workdir, 'results')
+        PROFILE_DIR = os.path.join(workdir, 'profiles')
+        WTF_CSRF_ENABLED = False
+
+    results = {}
+    with _Stage(results, 'parse', size):
+        elements = process_ifc_file(model_path)
+    element_count = len(elements)
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        init_db()
+        user = User(username='benchmark', email='benchmark@example.com')
+        user.set_password('benchmark')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        with _Stage(results, 'persist', element_count):
+            history = record_upload(os.path.basename(model_path), user_id, elements)
+            db.session.commit()
+        upload_id = history.id
+
+    del elements
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    api_url = f"/ifc/api/uploads/{upload_id}/elements"
+    last_offset = max(element_count - 100, 0)
+    with _Stage(results, 'preview', element_count):
+        for url in (f"/ifc/preview/{upload_id}",
+                    f"{api_url}?offset=0&limit=100",
+                    f"{api_url}?offset={last_offset}&limit=100&sort=-weight"):
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} が {response.status_code} を返しました")
+            response.close()
+
+    with _Stage(results, 'csv', element_count):
+        response = client.get(f"/ifc/download/{upload_id}")
+        csv_bytes = sum(len(chunk) for chunk in response.response)
+        response.close()
+
+    return {
+        'size': size,
+        'schema': schema,
+        'elements': element_count,
+        'file_mb': round(os.path.getsize(model_path) / (1024 * 1024), 2),
+        'csv_mb': round(csv_bytes / (1024 * 1024), 2),
+        'generate_seconds': round(generate_seconds, 2),
+        'stages': results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    計測結果を基準値と比較し、性能が低下した項目を返す
+
+    スループット（per_sec）が基準値より tolerance 以上下がった場合と、
+    最大RSSが基準値より tolerance 以上増えた場合を低下とみなす。
+    """
+    regressions = []
+    for result in results:
+        key = f"{result['schema']}-{result['size']}"
+        expected = baseline.get(key)
+        if expected is None:
+            continue
+        for stage, metrics in result['stages'].items():
+            base = expected['stages'].get(stage)
+            if base is None:
+                continue
+            if base['per_sec'] and metrics['per_sec'] is not None \
+                    and metrics['per_sec'] < base['per_sec'] * (1 - tolerance):
+                regressions.append(f"{key} {stage}: {metrics['per_sec']}/s (基準 {base['per_sec']}/s)")
+            if metrics['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+                regressions.append(f"{key} {stage}: 最大RSS {metrics['peak_rss_mb']}MB (基準 {base['peak_rss_mb']}MB)")
+    return regressions
+
+
+def _print_result(result):
+    print(f"\n[{result['schema']}] {result['size']} 部材  "
+          f"(IFC {result['file_mb']}MB, CSV {result['csv_mb']}MB, 生成 {result['generate_seconds']}s)")
+    print(f"  {'stage':<8} {'seconds':>10} {'per_sec':>12} {'peak_rss_mb':>12} {'growth_mb':>10}")
+    for stage, m in result['stages'].items():
+        print(f"  {stage:<8} {m['seconds']:>10} {m['per_sec'] or '-':>12} "
+              f"{m['peak_rss_mb']:>12} {m['rss_growth_mb']:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='IFC CONVERTERの性能計測')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='計測する部材数（カンマ区切り）')
+    parser.add_argument('--schema', choices=('IFC4', 'IFC2X3'), default='IFC4')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='基準値のJSONファイル')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='許容する性能低下の割合（既定: 0.25）')
+    parser.add_argument('--save-baseline', action='store_true', help='計測結果を基準値として保存する')
+    parser.add_argument('--output', help='計測結果をJSONで保存するパス')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='ifc-bench-') as workdir:
+        for size in sizes:
+            # 規模ごとに新しいプロセスで計測し、最大RSSを独立させる
+            with context.Pool(1) as pool:
+                result = pool.apply(run_scale, (size, args.schema, workdir))
+            _print_result(result)
+            results.append(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+        for result in results:
+            baseline[f"{result['schema']}-{result['size']}"] = result
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"\n基準値を保存しました: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n基準値がありません（比較に使う環境で --save-baseline を付けて実行すると {args.baseline} を作成できます）")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\n性能の低下を検出しました:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\n基準値からの性能低下はありません")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
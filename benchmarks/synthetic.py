@@ -0,0 +1,129 @@
+"""
+性能計測用の合成IFCモデルを生成する
+
+    python -m benchmarks.synthetic 10000 model.ifc --schema IFC2X3
+"""
+import argparse
+import ifcopenshell
+import ifcopenshell.guid
+
+# 鉄骨の代表的な断面（H形鋼・角形鋼管）
+PROFILES = [
+    ('H-200x100x5.5x8', 200.0, 100.0, 5.5, 8.0),
+    ('H-300x150x6.5x9', 300.0, 150.0, 6.5, 9.0),
+    ('H-400x200x8x13', 400.0, 200.0, 8.0, 13.0),
+    ('H-588x300x12x20', 588.0, 300.0, 12.0, 20.0),
+    ('H-350x350x12x19', 350.0, 350.0, 12.0, 19.0),
+]
+
+SUPPORTED_SCHEMAS = ('IFC4', 'IFC2X3')
+
+
+def _guid():
+    return ifcopenshell.guid.new()
+
+
+def generate_model(count, schema='IFC4', column_ratio=0.3):
+    """
+    梁と柱からなる合成モデルを生成する
+
+    各部材にプロパティセット（断面・重量）と数量セット（長さ）を関連付け、
+    IFC4では材料プロファイルセットも関連付ける。
+
+    Args:
+        count (int): 梁と柱の合計数
+        schema (str): 'IFC4' または 'IFC2X3'
+        column_ratio (float): 柱の割合
+
+    Returns:
+        ifcopenshell.file: 生成したモデル
+    """
+    if schema not in SUPPORTED_SCHEMAS:
+        raise ValueError(f"未対応のスキーマです: {schema}")
+
+    model = ifcopenshell.file(schema=schema)
+    owner = _owner_history(model)
+    material = model.create_entity('IfcMaterial', Name='SN490B')
+
+    # 材料プロファイルセットは断面ごとに共有する（IFC4以降）
+    profile_sets = []
+    for name, depth, width, web, flange in PROFILES:
+        if schema == 'IFC2X3':
+            profile_sets.append(None)
+            continue
+        profile = model.create_entity(
+            'IfcIShapeProfileDef', ProfileType='AREA', ProfileName=name,
+            OverallWidth=width, OverallDepth=depth, WebThickness=web, FlangeThickness=flange)
+        material_profile = model.create_entity('IfcMaterialProfile', Material=material, Profile=profile)
+        profile_sets.append(model.create_entity('IfcMaterialProfileSet', MaterialProfiles=[material_profile]))
+
+    column_every = max(int(round(1 / column_ratio)), 1) if column_ratio > 0 else 0
+    for i in range(count):
+        is_column = column_every and i % column_every == 0
+        ifc_type = 'IfcColumn' if is_column else 'IfcBeam'
+        profile_index = i % len(PROFILES)
+        profile_name = PROFILES[profile_index][0]
+        length = 3000.0 + (i % 40) * 150.0
+        weight = round(length / 1000.0 * (20.0 + profile_index * 30.0), 2)
+
+        element = model.create_entity(ifc_type, GlobalId=_guid(), OwnerHistory=owner,
+                                      Name=f"{'C' if is_column else 'B'}{i + 1}")
+
+        properties = [
+            _single_value(model, 'Weight', 'IfcMassMeasure', weight),
+            _single_value(model, 'Grade', 'IfcLabel', 'SN490B'),
+        ]
+        if schema == 'IFC2X3':
+            properties.append(_single_value(model, 'Profile', 'IfcLabel', profile_name))
+        pset = model.create_entity('IfcPropertySet', GlobalId=_guid(), OwnerHistory=owner,
+                                   Name='Pset_Fabrication', HasProperties=properties)
+        model.create_entity('IfcRelDefinesByProperties', GlobalId=_guid(), OwnerHistory=owner,
+                            RelatedObjects=[element], RelatingPropertyDefinition=pset)
+
+        quantities = [model.create_entity('IfcQuantityLength', Name='Length', LengthValue=length)]
+        qset = model.create_entity('IfcElementQuantity', GlobalId=_guid(), OwnerHistory=owner,
+                                   Name='Qto_MemberBaseQuantities', Quantities=quantities)
+        model.create_entity('IfcRelDefinesByProperties', GlobalId=_guid(), OwnerHistory=owner,
+                            RelatedObjects=[element], RelatingPropertyDefinition=qset)
+
+        relating_material = profile_sets[profile_index] or material
+        model.create_entity('IfcRelAssociatesMaterial', GlobalId=_guid(), OwnerHistory=owner,
+                            RelatedObjects=[element], RelatingMaterial=relating_material)
+
+    return model
+
+
+def _single_value(model, name, value_type, value):
+    return model.create_entity('IfcPropertySingleValue', Name=name,
+                               NominalValue=model.create_entity(value_type, value))
+
+
+def _owner_history(model):
+    person = model.create_entity('IfcPerson', FamilyName='Benchmark')
+    organization = model.create_entity('IfcOrganization', Name='Benchmark')
+    user = model.create_entity('IfcPersonAndOrganization', ThePerson=person, TheOrganization=organization)
+    application = model.create_entity('IfcApplication', ApplicationDeveloper=organization,
+                                      Version='1.0', ApplicationFullName='IFC CONVERTER benchmark',
+                                      ApplicationIdentifier='ifc-converter-benchmark')
+    return model.create_entity('IfcOwnerHistory', OwningUser=user, OwningApplication=application,
+                               ChangeAction='ADDED', CreationDate=0)
+
+
+def write_model(count, filepath, schema='IFC4'):
+    """合成モデルを生成してファイルに書き出す"""
+    generate_model(count, schema=schema).write(filepath)
+    return filepath
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='性能計測用の合成IFCモデルを生成する')
+    parser.add_argument('count', type=int, help='梁と柱の合計数')
+    parser.add_argument('output', help='出力先のIFCファイル')
+    parser.add_argument('--schema', choices=SUPPORTED_SCHEMAS, default='IFC4')
+    args = parser.parse_args(argv)
+    write_model(args.count, args.output, schema=args.schema)
+    print(f"{args.output}: {args.count} 部材 ({args.schema})")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,16 +4,99 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 INSTANCE_DIR = os.path.join(BASE_DIR, 'instance')
 DATABASE_PATH = os.path.join(INSTANCE_DIR, 'ifc_converter.db')
 
+
+def engine_options(database_uri):
+    """
+    データベースに応じたSQLAlchemyのエンジン設定
+
+    PostgreSQLなどではgunicornワーカー1つあたりの接続プールの大きさを環境変数で調整する
+    （ワーカー数 × (DB_POOL_SIZE + DB_MAX_OVERFLOW) がDBの最大接続数を超えないようにする）。
+    SQLiteではロック待ちの時間だけを指定する（WALなどの設定は接続時に行う、ifc_app.db参照）。
+    """
+    options = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
+    if database_uri.startswith('sqlite'):
+        options["connect_args"] = {"timeout": float(os.environ.get('SQLITE_BUSY_TIMEOUT', 30))}
+        return options
+    options.update({
+        "pool_size": int(os.environ.get('DB_POOL_SIZE', 5)),
+        "max_overflow": int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        "pool_timeout": int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    })
+    return options
+
+
 class Config:
     SECRET_KEY = os.environ.get('SESSION_SECRET', 'dev')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', f"sqlite:///{DATABASE_PATH}")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        "pool_recycle": 300,
-        "pool_pre_ping": True,
-    }
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
+    # 分割アップロードで受け付けるIFCファイルの最大サイズと1回の送信サイズ
+    MAX_IFC_FILE_SIZE = int(os.environ.get('MAX_IFC_FILE_SIZE', 1024 * 1024 * 1024))  # 1GB
+    UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # 5MB
+    # 再開されないまま放置された分割アップロードを削除するまでの時間（秒）
+    CHUNKED_UPLOAD_TTL = 24 * 60 * 60
+    # 一括アップロード（複数ファイル・ZIP）で1回に受け付けるIFCファイル数
+    BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 200))
+    # 変換履歴の1ページあたりの件数
+    HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 50))
+    # 解析の前にファイルを事前走査し、対応していないスキーマ・抽出対象の要素がないファイルを受け付けない
+    PRESCAN = os.environ.get('PRESCAN', '1') == '1'
+    # 受け付けるIFCスキーマ（カンマ区切り、IFC4X3はIFC4X3_ADD2なども含む。空なら確認しない）
+    SUPPORTED_SCHEMAS = [s.strip().upper() for s in os.environ.get('SUPPORTED_SCHEMAS', 'IFC2X3,IFC4,IFC4X3').split(',')
+                         if s.strip()]
+    # 同時に実行する解析が使う推定メモリの上限（バイト、0なら制限しない）と、
+    # 事前走査したエンティティ1件あたりの推定メモリ使用量（バイト）
+    PARSE_MEMORY_LIMIT = int(os.environ.get('PARSE_MEMORY_LIMIT', 0))
+    PARSE_MEMORY_PER_ENTITY = int(os.environ.get('PARSE_MEMORY_PER_ENTITY', 2048))
+    # 解析ジョブを実行するプロセス数
+    PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', os.cpu_count() or 1))
+    # 1ファイルの抽出を分割するプロセス数（1なら並列化しない）
+    PARSE_EXTRACT_WORKERS = int(os.environ.get('PARSE_EXTRACT_WORKERS', 1))
+    # 抽出する要素種別（カンマ区切り、未指定なら抽出仕様の全種別）
+    EXTRACTION_TYPES = [t.strip() for t in os.environ.get('EXTRACTION_TYPES', '').split(',') if t.strip()]
+    # 数量セット・プロパティから長さ・重量が得られない要素は形状から求める
+    GEOMETRY_QUANTITIES = os.environ.get('GEOMETRY_QUANTITIES', '0') == '1'
+    # 形状から数量を求める要素種別（カンマ区切り、未指定なら梁・柱・部材）
+    GEOMETRY_TYPES = [t.strip() for t in os.environ.get('GEOMETRY_TYPES', '').split(',') if t.strip()]
+    # 形状の三角形分割に使うスレッド数（解析ジョブ1つあたり）
+    GEOMETRY_THREADS = int(os.environ.get('GEOMETRY_THREADS', max(1, (os.cpu_count() or 1) // PARSE_WORKERS)))
+    # 材料名から密度が分からない場合の密度（kg/m3、0なら重量を求めない）。既定は鋼材
+    GEOMETRY_DEFAULT_DENSITY = float(os.environ.get('GEOMETRY_DEFAULT_DENSITY', 7850))
+    # 解析の進捗をジョブに書き込む最小間隔（秒）
+    JOB_PROGRESS_INTERVAL = float(os.environ.get('JOB_PROGRESS_INTERVAL', 0.5))
+    # 進捗のServer-Sent Eventsで状態を確認する間隔と、1回の接続を維持する時間（秒）
+    # 接続中はgthreadワーカーのスレッドを占有するため、短く区切ってブラウザに再接続させる
+    JOB_EVENTS_POLL_INTERVAL = float(os.environ.get('JOB_EVENTS_POLL_INTERVAL', 1.0))
+    JOB_EVENTS_TIMEOUT = float(os.environ.get('JOB_EVENTS_TIMEOUT', 20))
+    # Webワーカー1つあたりの同時接続数の上限（超えた場合はブラウザがポーリングに切り替える）
+    JOB_EVENTS_MAX_STREAMS = int(os.environ.get('JOB_EVENTS_MAX_STREAMS', 2))
+    # 解析結果キャッシュの保存先と容量上限
+    PARSE_CACHE_DIR = os.environ.get('PARSE_CACHE_DIR', os.path.join(INSTANCE_DIR, 'parse_cache'))
+    PARSE_CACHE_MAX_BYTES = int(os.environ.get('PARSE_CACHE_MAX_BYTES', 1024 * 1024 * 1024))  # 1GB
+    # 解析結果の保存先（sql: Elementテーブル、columnar: RESULT_DATA_DIR の列指向ファイル）
+    RESULT_STORAGE = os.environ.get('RESULT_STORAGE', 'sql')
+    RESULT_DATA_DIR = os.environ.get('RESULT_DATA_DIR', os.path.join(INSTANCE_DIR, 'results'))
+    # ブラウザが対応していればCSVをgzip圧縮して送信する
+    CSV_GZIP = os.environ.get('CSV_GZIP', '1') == '1'
+    # 処理段階の計測値の保存先（プロセスごとに書き出し、/metricsで合算する）
+    METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(INSTANCE_DIR, 'metrics'))
+    # メモリ計測にtracemallocを使う（処理が遅くなるため通常は無効）
+    METRICS_TRACEMALLOC = os.environ.get('METRICS_TRACEMALLOC', '0') == '1'
+    # /metricsにはAuthorization: Bearer <token>が必要（未設定の場合、METRICS_PUBLICが無効なら常に拒否する）
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # METRICS_TOKENなしで/metricsを公開する（内部ネットワークからのみ到達できる場合に限る）
+    METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC', '0') == '1'
+    # 解析のプロファイル（pstats形式）の保存先
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(INSTANCE_DIR, 'profiles'))
+    # 全ての解析をプロファイラの下で実行する（管理者が調査時に有効にする）
+    PROFILE_ALL_PARSES = os.environ.get('PROFILE_ALL_PARSES', '0') == '1'
+    # アップロード時に X-IFC-Profile: 1 ヘッダーでプロファイルを要求できるようにする
+    PROFILE_ALLOW_HEADER = os.environ.get('PROFILE_ALLOW_HEADER', '1') == '1'
 
     # 必要なディレクトリを作成
     os.makedirs(INSTANCE_DIR, exist_ok=True)
@@ -1,32 +0,0 @@
-from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField
-from wtforms.validators import DataRequired, Email, Length, EqualTo, ValidationError
-from models import User
-
-class LoginForm(FlaskForm):
-    email = StringField('メールアドレス', validators=[DataRequired(), Email()])
-    password = PasswordField('パスワード', validators=[DataRequired()])
-    submit = SubmitField('ログイン')
-
-class RegistrationForm(FlaskForm):
-    username = StringField('ユーザー名', validators=[DataRequired()])
-    email = StringField('メールアドレス', validators=[DataRequired(), Email()])
-    password = PasswordField('パスワード', validators=[
-        DataRequired(),
-        Length(min=6, message='パスワードは6文字以上である必要があります'),
-    ])
-    password2 = PasswordField(
-        'パスワード（確認）',
-        validators=[DataRequired(), EqualTo('password', message='パスワードが一致しません')]
-    )
-    submit = SubmitField('登録')
-
-    def validate_username(self, field):
-        user = User.query.filter_by(username=field.data).first()
-        if user is not None:
-            raise ValidationError('このユーザー名は既に使用されています')
-
-    def validate_email(self, field):
-        user = User.query.filter_by(email=field.data).first()
-        if user is not None:
-            raise ValidationError('このメールアドレスは既に登録されています')
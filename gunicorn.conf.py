@@ -0,0 +1,53 @@
+"""
+gunicornの設定
+
+    gunicorn -c gunicorn.conf.py main:app
+
+ワーカー数・スレッド数は環境変数で変更できる。SSE（解析の進捗）やCSVの
+ストリーミングで接続を長く保持するため、スレッドを使うgthreadワーカーを使う。
+IFCの解析は各ワーカーのプロセスプール（PARSE_WORKERS）で行うため、
+Webワーカーの数はCPU数程度に抑える。
+"""
+import os
+import multiprocessing
+
+_cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', max(2, _cpus)))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+reuse_port = True
+
+# 解析プロセスはWebワーカーごとに起動するため、合計がCPU数程度になるよう既定値を決める
+# （アプリの読み込み前に設定する必要がある）
+os.environ.setdefault('PARSE_WORKERS', str(max(1, _cpus // workers)))
+
+# 開発時（GUNICORN_RELOAD=1）はコードの変更で再起動し、本番ではアプリを事前に読み込んで
+# ワーカー間で共有する（--reloadと--preloadは併用できない）
+reload = os.environ.get('GUNICORN_RELOAD', '0') == '1'
+preload_app = not reload
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def child_exit(server, worker):
+    """終了したワーカーの計測値を /metrics の合算に含めないよう、そのファイルを削除する"""
+    from config import Config
+    from ifc_app.metrics import prune_dead_processes
+    prune_dead_processes(Config.METRICS_DIR, [worker.pid])
+
+
+def post_fork(server, worker):
+    """事前読み込みしたアプリのDB接続をワーカー間で共有しないよう、fork後に破棄する"""
+    if not preload_app:
+        return
+    from main import app
+    from ifc_app import db
+    with app.app_context():
+        db.engine.dispose(close=False)
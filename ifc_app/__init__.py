@@ -37,6 +37,18 @@ def create_app(config_class=Config):
     # LoginManagerの初期化
     login_manager.init_app(app)
 
+    # 解析ジョブキューの初期化
+    from . import jobs
+    jobs.init_app(app, config_class)
+
+    # 処理段階の計測
+    from . import metrics
+    metrics.init_app(app)
+
+    # 管理コマンドの登録
+    from .cli import ifc_cli
+    app.cli.add_command(ifc_cli)
+
     # ルートURLのリダイレクト処理
     @app.route('/')
     def index():
@@ -52,16 +64,8 @@ def create_app(config_class=Config):
         from .ifc_processor import bp as ifc_bp
         app.register_blueprint(ifc_bp, url_prefix='/ifc')
 
-        # モデルのインポート（create_all()の前に必要）
+        # モデルのインポート
         from . import models
 
-        # データベースの作成
-        logger.info("Creating database tables...")
-        try:
-            db.create_all()
-            logger.info("Database tables created successfully")
-        except Exception as e:
-            logger.error(f"Error creating database tables: {str(e)}")
-            raise
-
+    # テーブルの作成は起動のたびではなく flask ifc init-db で一度だけ行う
     return app
\ No newline at end of file
@@ -0,0 +1,129 @@
+import os
+import time
+import click
+import logging
+from flask import current_app
+from flask.cli import AppGroup
+from .db import db, init_db
+from .models import User, UploadHistory
+from .results import migrate_upload
+from .utils.exporters import EXPORT_FORMATS, get_export_format
+
+logger = logging.getLogger(__name__)
+
+ifc_cli = AppGroup('ifc', help='IFC CONVERTERの管理コマンド')
+
+
+@ifc_cli.command('init-db')
+def init_db_command():
+    """テーブルを作成し、既存のテーブルに不足している列・インデックスを追加する"""
+    added = init_db()
+    for name in added:
+        click.echo(f"追加しました: {name}")
+    click.echo("データベースを初期化しました")
+
+
+@ifc_cli.command('migrate-elements')
+def migrate_elements():
+    """旧形式のJSON（processed_data）を設定された保存先（RESULT_STORAGE）へ移行する"""
+    init_db()
+    upload_ids = [row.id for row in db.session.execute(
+        db.select(UploadHistory.id)
+        .where(UploadHistory.processed_data.is_not(None))
+        .order_by(UploadHistory.id)
+    )]
+
+    migrated = 0
+    skipped = 0
+    for upload_id in upload_ids:
+        upload = db.session.get(UploadHistory, upload_id)
+        try:
+            count, invalid = migrate_upload(upload)
+            if count is None:
+                skipped += 1
+                click.echo(f"#{upload_id} {upload.filename}: 数値に変換できない重量・長さが {invalid} 件あるため"
+                           f"移行しませんでした（旧形式のまま残します）", err=True)
+                continue
+            db.session.commit()
+            migrated += 1
+            click.echo(f"#{upload_id} {upload.filename}: {count} 要素")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"履歴 {upload_id} の移行中にエラーが発生: {str(e)}")
+            click.echo(f"#{upload_id} の移行に失敗しました: {str(e)}", err=True)
+
+    click.echo(f"{migrated}/{len(upload_ids)} 件の履歴を移行しました")
+    if skipped:
+        click.echo(f"{skipped} 件の履歴は数値に変換できない値があるため旧形式のまま残しました")
+
+
+@ifc_cli.command('convert')
+@click.argument('inputs', nargs=-1, required=True)
+@click.option('-o', '--output-dir', default='.', show_default=True, type=click.Path(file_okay=False),
+              help='出力先のディレクトリ')
+@click.option('-f', '--format', 'formats', multiple=True, default=('csv',), show_default=True,
+              type=click.Choice(list(EXPORT_FORMATS)), help='出力形式（複数指定可）')
+@click.option('-w', '--workers', type=int, default=None, help='並列に変換するプロセス数（既定: PARSE_WORKERS）')
+@click.option('--record', 'record_email', metavar='EMAIL', default=None,
+              help='指定したメールアドレスのユーザーの変換履歴にも保存する')
+@click.option('--skip-existing', is_flag=True, help='全ての形式の出力が既にあるファイルは変換しない')
+def convert_command(inputs, output_dir, formats, workers, record_email, skip_existing):
+    """
+    IFCファイルを一括で変換する
+
+    INPUTSにはディレクトリ（配下の .ifc を再帰的に検索）・globパターン（** で再帰）・ファイルを指定する。
+    """
+    from .convert import collect_inputs, output_stems, convert_files
+
+    formats = list(dict.fromkeys(formats))
+    for name in formats:
+        try:
+            get_export_format(name)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+
+    user_id = None
+    if record_email:
+        init_db()
+        user = User.query.filter_by(email=record_email).first()
+        if user is None:
+            raise click.UsageError(f"ユーザーが見つかりません: {record_email}")
+        user_id = user.id
+
+    paths, missing = collect_inputs(inputs)
+    for pattern in missing:
+        click.echo(f"IFCファイルが見つかりません: {pattern}", err=True)
+    stems = output_stems(paths)
+    if skip_existing:
+        extensions = [EXPORT_FORMATS[name].extension for name in formats]
+        pending = [
+            (path, stem) for path, stem in zip(paths, stems)
+            if not all(os.path.exists(os.path.join(output_dir, f"{stem}.{extension}")) for extension in extensions)
+        ]
+        paths, stems = [path for path, _ in pending], [stem for _, stem in pending]
+    if not paths:
+        click.echo("変換するファイルがありません")
+        return
+
+    workers = workers or current_app.config['PARSE_WORKERS']
+    config_class = current_app.extensions['ifc_jobs']['config_class']
+    click.echo(f"{len(paths)} ファイルを {min(workers, len(paths))} プロセスで変換します")
+
+    started = time.perf_counter()
+    failed = 0
+    elements = 0
+    for done, result in enumerate(convert_files(paths, stems, output_dir, formats, workers, config_class, user_id), start=1):
+        prefix = f"[{done}/{len(paths)}] {result.path}"
+        if result.error is not None:
+            failed += 1
+            click.echo(f"{prefix}: 失敗しました: {result.error}", err=True)
+            continue
+        elements += result.element_count
+        saved = f"、履歴 #{result.upload_id}" if result.upload_id is not None else ''
+        click.echo(f"{prefix}: {result.element_count} 要素 {result.parse_seconds + result.write_seconds:.2f}秒 "
+                   f"（解析 {result.parse_seconds:.2f}秒、出力 {result.write_seconds:.2f}秒{saved}）")
+
+    click.echo(f"{len(paths) - failed}/{len(paths)} ファイルを変換しました"
+               f"（{elements} 要素、{time.perf_counter() - started:.1f}秒）")
+    if failed:
+        raise SystemExit(1)
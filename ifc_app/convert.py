@@ -0,0 +1,203 @@
+"""
+IFCファイルの一括変換（コマンドライン）
+
+ディレクトリ・globパターン・ファイルで指定したIFCファイルをプロセスプールで並列に解析し、
+指定した形式（exporters参照）のファイルへ出力する。必要であれば変換履歴にも保存する。
+抽出仕様・形状から数量を求める設定はWebからの解析と同じ設定（config.py）に従う。
+
+    flask --app main ifc convert models/ "archive/**/*.ifc" -o out -f csv -f xlsx -w 8
+    python -m ifc_app.convert models/ -o out --record user@example.com
+"""
+import os
+import sys
+import glob
+import time
+import logging
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .utils.exporters import ELEMENT_COLUMNS, element_records, get_export_format
+
+logger = logging.getLogger(__name__)
+
+# 1ファイルの変換結果（失敗した場合はerrorにメッセージ）
+ConvertResult = namedtuple('ConvertResult', (
+    'path', 'element_count', 'outputs', 'upload_id', 'parse_seconds', 'write_seconds', 'error'
+))
+
+# ワーカープロセス内で使用するアプリケーション
+_worker_app = None
+
+
+def collect_inputs(inputs):
+    """
+    ディレクトリ（配下の .ifc を再帰的に検索）・globパターン・ファイルから変換するファイルを集める
+
+    Args:
+        inputs (iterable): ディレクトリ・globパターン（** で再帰）・ファイルのパス
+
+    Returns:
+        tuple: (ファイルのパスのリスト（重複を除き指定順）, 該当するファイルがなかった指定のリスト)
+    """
+    paths = []
+    seen = set()
+    missing = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            found = sorted(
+                os.path.join(root, name)
+                for root, _, names in os.walk(pattern)
+                for name in names if name.lower().endswith('.ifc')
+            )
+        elif glob.has_magic(pattern):
+            found = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        else:
+            found = [pattern] if os.path.isfile(pattern) else []
+        if not found:
+            missing.append(pattern)
+        for path in found:
+            key = os.path.realpath(path)
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+    return paths, missing
+
+
+def output_stems(paths):
+    """出力ファイル名（拡張子を除く）。元ファイル名が重複する場合は連番を付ける"""
+    stems = []
+    used = set()
+    for path in paths:
+        base = os.path.splitext(os.path.basename(path))[0]
+        stem = base
+        number = 2
+        while stem.lower() in used:
+            stem = f"{base}_{number}"
+            number += 1
+        used.add(stem.lower())
+        stems.append(stem)
+    return stems
+
+
+def _init_worker(config_class):
+    """プロセスプールの各ワーカーで一度だけアプリを生成する"""
+    global _worker_app
+    from . import create_app
+    _worker_app = create_app(config_class)
+
+
+def _write_output(path, export_format, rows):
+    """行を指定した形式で出力する（書き終えてから置き換えるため、途中で失敗しても壊れたファイルを残さない）"""
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in export_format.writer(ELEMENT_COLUMNS, element_records(rows)):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def convert_file(path, stem, output_dir, formats, user_id=None):
+    """
+    ワーカープロセスで1つのIFCファイルを解析し、各形式のファイルへ出力する
+
+    複数の形式へ出力し履歴にも保存するため、解析結果は1ファイル分まとめて保持する
+    （IFCモデル本体より十分に小さい）。ファイルごとに並列化するため、1ファイルの抽出は
+    単一プロセスで行う（PARSE_EXTRACT_WORKERSは使わない）。
+
+    Args:
+        path (str): IFCファイルのパス
+        stem (str): 出力ファイル名（拡張子を除く）
+        output_dir (str): 出力先のディレクトリ
+        formats (list): 出力形式の名前
+        user_id (int): 指定した場合、このユーザーの変換履歴に保存する
+
+    Returns:
+        ConvertResult: 変換結果
+    """
+    from .db import db
+    from .jobs import get_extraction_spec, get_geometry_options
+    from .results import record_upload
+    from .utils.ifc_parser import process_ifc_file
+
+    with _worker_app.app_context():
+        started = time.perf_counter()
+        parse_seconds = None
+        try:
+            rows = process_ifc_file(path, spec=get_extraction_spec(), geometry=get_geometry_options())
+            parse_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            outputs = []
+            for name in formats:
+                export_format = get_export_format(name)
+                output_path = os.path.join(output_dir, f"{stem}.{export_format.extension}")
+                _write_output(output_path, export_format, rows)
+                outputs.append(output_path)
+
+            upload_id = None
+            if user_id is not None:
+                history = record_upload(os.path.basename(path), user_id, rows)
+                db.session.commit()
+                upload_id = history.id
+            return ConvertResult(path, len(rows), outputs, upload_id, parse_seconds,
+                                 time.perf_counter() - started, None)
+
+        except Exception as e:
+            logger.error(f"{path} の変換中にエラーが発生: {str(e)}")
+            db.session.rollback()
+            return ConvertResult(path, None, [], None, parse_seconds, None, str(e))
+
+
+def convert_files(paths, stems, output_dir, formats, workers, config_class, user_id=None):
+    """
+    ファイルをプロセスプールで並列に変換し、完了した順に結果を返す
+
+    Args:
+        paths (list): IFCファイルのパス
+        stems (list): ファイルごとの出力ファイル名（拡張子を除く、output_stems参照）
+        output_dir (str): 出力先のディレクトリ
+        formats (list): 出力形式の名前
+        workers (int): プロセス数
+        config_class: ワーカーでアプリを生成する設定クラス
+        user_id (int): 指定した場合、このユーザーの変換履歴に保存する
+
+    Yields:
+        ConvertResult: 変換結果（完了順）
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(paths) or 1)),
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker,
+                             initargs=(config_class,)) as executor:
+        futures = {
+            executor.submit(convert_file, path, stem, output_dir, list(formats), user_id): path
+            for path, stem in zip(paths, stems)
+        }
+        try:
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    # ワーカープロセスの異常終了など
+                    yield ConvertResult(futures[future], None, [], None, None, None, str(e))
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+def main(argv=None):
+    """アプリを生成し、flask ifc convert と同じコマンドを実行する"""
+    from . import create_app
+    from .cli import convert_command
+
+    app = create_app()
+    with app.app_context():
+        return convert_command.main(args=argv, prog_name='python -m ifc_app.convert')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
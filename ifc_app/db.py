@@ -1,3 +1,106 @@
+import logging
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
 
-db = SQLAlchemy()
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+db = SQLAlchemy()
+
+
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite(dbapi_connection, connection_record):
+    """
+    SQLiteの接続ごとにWALモードを設定する
+
+    WALモードでは解析結果の書き込み中もプレビューなどの読み込みが待たされない。
+    ロック待ち時間（busy_timeout）は接続時のtimeoutで指定する（config.engine_options参照）。
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+    finally:
+        cursor.close()
+
+
+def add_missing_columns():
+    """
+    既存のテーブルにモデルで追加された列を追加する
+
+    create_all()は既存のテーブルを変更しないため、init_db()であわせて実行する。
+    追加する列はNULL可とするか、server_defaultを指定しておく必要がある。
+
+    Returns:
+        list: 追加した列（"テーブル.列"）
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" ' \
+                      f'{column.type.compile(dialect=engine.dialect)}'
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    if isinstance(default, str):
+                        default = "'" + default.replace("'", "''") + "'"
+                    else:
+                        default = default.compile(dialect=engine.dialect)
+                    ddl += f" DEFAULT {default}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                connection.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+    if added:
+        logger.info(f"列を追加しました: {', '.join(added)}")
+    return added
+
+
+def add_missing_indexes():
+    """
+    既存のテーブルにモデルで追加されたインデックスを作成する
+
+    Returns:
+        list: 作成したインデックス名
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                index.create(bind=connection)
+                added.append(index.name)
+    if added:
+        logger.info(f"インデックスを作成しました: {', '.join(added)}")
+    return added
+
+
+def init_db():
+    """
+    テーブルを作成し、既存のテーブルに不足している列・インデックスを追加する（flask ifc init-db）
+
+    Returns:
+        list: 追加した列とインデックス
+    """
+    # モデルを読み込んでからテーブルを作成する
+    from . import models  # noqa: F401
+    db.create_all()
+    return add_missing_columns() + add_missing_indexes()
@@ -1,18 +1,43 @@
 import os
 import json
-from flask import Blueprint, render_template, request, send_file, flash, redirect, url_for, current_app
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import quote
+from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app, jsonify, abort, Response, stream_with_context, send_file
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from .models import UploadHistory, UploadBatch, ParseJob, ChunkedUpload
 from . import db
-from .models import UploadHistory
-from .utils.ifc_parser import process_ifc_file
-from .utils.csv_generator import generate_csv, generate_csv_filename
+from .jobs import enqueue_parse_job, get_parse_cache, cache_key_for, prescan_upload
+from .results import query_elements, iter_upload_elements, summarize_elements, merge_summaries, \
+    iter_diff, has_global_ids, DIFF_ADDED, DIFF_REMOVED, DIFF_CHANGED
+from .metrics import stage, timed_iter, file_size_bucket, element_count_bucket
+from .utils.upload_stream import StreamingUpload, UploadRejected, receive_stream, hash_file
+from .utils.profiling import pstats_to_speedscope
+from .utils.archive import is_zip_filename, iter_ifc_members
+from .utils.csv_generator import gzip_chunks
+from .utils.exporters import ELEMENT_COLUMNS, BATCH_COLUMNS, SUMMARY_COLUMNS, DIFF_COLUMNS, element_records, \
+    batch_records, summary_records, diff_records, available_formats, get_export_format, generate_export_filename
 import logging
 
 logger = logging.getLogger(__name__)
 bp = Blueprint('ifc', __name__)
 
+# プレビューAPIの1ページあたりの件数
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# 差分のページに表示する最大件数（全件はCSVで出力する）
+DIFF_DISPLAY_LIMIT = 500
+# 差分の比較元として選択肢に表示する履歴の件数
+DIFF_BASE_CHOICES = 100
+
+# 進捗のServer-Sent Eventsの同時接続数を制限するセマフォ（プロセスごと、初回の接続時に作成）
+_event_streams = None
+_event_streams_lock = threading.Lock()
+
 def allowed_file(filename):
     """アップロード可能なファイル拡張子をチェック"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'ifc'
@@ -22,6 +47,66 @@ def allowed_file(filename):
 def index():
     return render_template('ifc/index.html')
 
+def _new_upload_path(filename):
+    # 解析待ちの間に同名ファイルが上書きされないよう一意な名前で保存
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
+
+def _remove_file(filepath):
+    if filepath and os.path.exists(filepath):
+        os.remove(filepath)
+
+def _profile_requested():
+    """このアップロードの解析をプロファイラの下で実行するか"""
+    if current_app.config['PROFILE_ALL_PARSES']:
+        return True
+    return current_app.config['PROFILE_ALLOW_HEADER'] and request.headers.get('X-IFC-Profile') == '1'
+
+def _find_pending_job(file_hash):
+    """現在のユーザーの、同じ内容のファイルを解析中のジョブを返す"""
+    if not file_hash:
+        return None
+    return ParseJob.query.filter(
+        ParseJob.user_id == current_user.id,
+        ParseJob.file_hash == file_hash,
+        ParseJob.status.in_((ParseJob.STATUS_QUEUED, ParseJob.STATUS_RUNNING))
+    ).order_by(ParseJob.id.desc()).first()
+
+def _start_processing(filename, filepath, file_hash, batch_id=None):
+    """
+    受信済みのファイルの解析を開始し、遷移先のURLを返す
+
+    一括アップロードのファイル（batch_id指定時）は、他の解析中のジョブとまとめず
+    それぞれ履歴を作成する。事前走査で解析できないと分かったファイルはUploadRejectedを送出する。
+    """
+    bucket = file_size_bucket(os.path.getsize(filepath))
+    profile = _profile_requested()
+
+    # 同じファイルの解析が既に待機中・実行中なら、そのジョブの状況ページへ案内する
+    pending = _find_pending_job(file_hash) if not profile and batch_id is None else None
+    if pending is not None:
+        _remove_file(filepath)
+        return url_for('ifc.job_status', job_id=pending.id)
+
+    # モデルを読み込む前に、解析できないファイルを拒否する（UploadRejected）
+    scan = None
+    if current_app.config['PRESCAN']:
+        with stage('prescan', bucket):
+            scan = prescan_upload(filepath)
+
+    # 同じ内容のファイルが解析済みなら、ワーカーがキャッシュから履歴を作成する
+    # （全行の複製に時間がかかるため、リクエスト内では行わない）。
+    # 解析しないため、推定メモリによる実行の制御は行わない
+    if not profile:
+        with stage('cache_lookup', bucket):
+            if get_parse_cache().contains(cache_key_for(file_hash)):
+                scan = None
+
+    # 解析はワーカーで実行し、すぐにジョブの状況ページを返す
+    with stage('enqueue', bucket):
+        job = enqueue_parse_job(filename, filepath, current_user.id, file_hash=file_hash,
+                                profile=profile, batch_id=batch_id, scan=scan)
+    return url_for('ifc.job_status', job_id=job.id)
+
 @bp.route('/upload', methods=['POST'])
 @login_required
 def upload_file():
@@ -35,71 +120,612 @@ def upload_file():
         return redirect(url_for('ifc.index'))
 
     if file and allowed_file(file.filename):
+        filename = secure_filename(file.filename)
+        filepath = _new_upload_path(filename)
         try:
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-
-            elements = process_ifc_file(filepath)
-
-            # 履歴に保存
-            history = UploadHistory(
-                filename=filename,
-                processed_date=datetime.now(),
-                element_count=len(elements),
-                user_id=current_user.id,
-                processed_data=json.dumps(elements)
-            )
-            db.session.add(history)
-            db.session.commit()
-
-            # 一時ファイルを削除
-            os.remove(filepath)
+            with stage('receive', file_size_bucket(request.content_length)):
+                file_hash = receive_stream(file.stream, filepath, current_app.config['MAX_IFC_FILE_SIZE'])
+            return redirect(_start_processing(filename, filepath, file_hash))
 
-            return redirect(url_for('ifc.preview', upload_id=history.id))
+        except UploadRejected as e:
+            _remove_file(filepath)
+            flash(str(e), 'error')
+            return redirect(url_for('ifc.index'))
 
         except Exception as e:
             logger.error(f"ファイル処理エラー: {str(e)}")
+            db.session.rollback()
+            _remove_file(filepath)
             flash(f"ファイルの処理中にエラーが発生しました: {str(e)}", 'error')
             return redirect(url_for('ifc.index'))
     else:
         flash('無効なファイル形式です。IFCファイルをアップロードしてください。', 'error')
         return redirect(url_for('ifc.index'))
 
+def _receive_batch_file(batch_id, filename, stream, rejected):
+    """
+    一括アップロードの1ファイルを保存して解析を開始する
+
+    Returns:
+        bool: 受け付けた場合はTrue（受け付けなかった理由はrejectedに追加する）
+    """
+    filename = secure_filename(filename) or 'upload.ifc'
+    filepath = _new_upload_path(filename)
+    try:
+        file_hash = receive_stream(stream, filepath, current_app.config['MAX_IFC_FILE_SIZE'])
+        _start_processing(filename, filepath, file_hash, batch_id=batch_id)
+        return True
+    except UploadRejected as e:
+        rejected.append(f"{filename}: {str(e)}")
+    except Exception as e:
+        logger.error(f"ファイル処理エラー ({filename}): {str(e)}")
+        db.session.rollback()
+        rejected.append(f"{filename}: ファイルの処理中にエラーが発生しました")
+    _remove_file(filepath)
+    return False
+
+@bp.route('/batches', methods=['POST'])
+@login_required
+def upload_batch():
+    """
+    複数のIFCファイル・ZIPファイルをまとめて受け付け、ファイルごとに解析ジョブを登録する
+
+    ZIPは一時ファイルから1ファイルずつ展開しながら保存する。各ファイルの解析は
+    解析ワーカーで並列に行われ、バッチのページでまとめて確認・ダウンロードできる。
+    """
+    files = [file for file in request.files.getlist('files') if file.filename]
+    if not files:
+        flash('ファイルが選択されていません', 'error')
+        return redirect(url_for('ifc.index'))
+
+    name = files[0].filename if len(files) == 1 else f"{files[0].filename} ほか {len(files) - 1} ファイル"
+    batch = UploadBatch(name=name, user_id=current_user.id)
+    db.session.add(batch)
+    db.session.commit()
+
+    max_files = current_app.config['BATCH_MAX_FILES']
+    accepted = 0
+    rejected = []
+    with stage('receive_batch', file_size_bucket(request.content_length)):
+        for file in files:
+            if is_zip_filename(file.filename):
+                try:
+                    for member_name, member in iter_ifc_members(file.stream, max_files - accepted):
+                        accepted += _receive_batch_file(batch.id, member_name, member, rejected)
+                except UploadRejected as e:
+                    rejected.append(f"{file.filename}: {str(e)}")
+            elif not allowed_file(file.filename):
+                rejected.append(f"{file.filename}: IFCファイルまたはZIPファイルではありません")
+            elif accepted >= max_files:
+                rejected.append(f"{file.filename}: ファイル数が上限（{max_files} ファイル）を超えています")
+            else:
+                accepted += _receive_batch_file(batch.id, file.filename, file.stream, rejected)
+
+    for message in rejected:
+        flash(message, 'error')
+    if not accepted:
+        db.session.delete(batch)
+        db.session.commit()
+        if not rejected:
+            flash('IFCファイルが含まれていません', 'error')
+        return redirect(url_for('ifc.index'))
+    return redirect(url_for('ifc.batch_status', batch_id=batch.id))
+
+def _get_own_batch(batch_id):
+    batch = db.session.get(UploadBatch, batch_id)
+    if batch is None or batch.user_id != current_user.id:
+        abort(404)
+    return batch
+
+def _batch_uploads(batch):
+    """バッチの完了済みの履歴（ファイル名順）"""
+    return UploadHistory.query.filter_by(batch_id=batch.id, complete=True)\
+        .order_by(UploadHistory.filename, UploadHistory.id).all()
+
+def _batch_files(batch):
+    """
+    バッチのファイルごとの状況（ファイル名順）
+
+    バッチのファイルは解析結果キャッシュから作成した場合も含めて必ず解析ジョブを持つ。
+    """
+    uploads = {upload.id: upload for upload in _batch_uploads(batch)}
+    files = []
+    for job in ParseJob.query.filter_by(batch_id=batch.id).order_by(ParseJob.filename, ParseJob.id):
+        data = _job_data(job)
+        upload = uploads.get(job.upload_id)
+        data['element_count'] = upload.element_count if upload is not None else None
+        files.append(data)
+    return files
+
+def _batch_data(batch):
+    files = _batch_files(batch)
+    return {
+        'id': batch.id,
+        'name': batch.name,
+        'files': files,
+        'finished': all(data['status'] in (ParseJob.STATUS_DONE, ParseJob.STATUS_FAILED) for data in files),
+        'element_count': sum(data.get('element_count') or 0 for data in files),
+    }
+
+@bp.route('/batches/<int:batch_id>')
+@login_required
+def batch_status(batch_id):
+    batch = _get_own_batch(batch_id)
+    return render_template('ifc/batch.html', batch=batch, data=_batch_data(batch))
+
+@bp.route('/batches/<int:batch_id>/status')
+@login_required
+def batch_status_api(batch_id):
+    return jsonify(_batch_data(_get_own_batch(batch_id)))
+
+@bp.route('/batches/<int:batch_id>/download')
+@login_required
+def download_batch(batch_id):
+    """バッチの完了済みのファイルの要素を、元ファイル名の列を付けた1つのファイルで返す（?format= で形式を指定）"""
+    uploads = _batch_uploads(_get_own_batch(batch_id))
+    sources = [(upload.filename, iter_upload_elements(upload)) for upload in uploads]
+    return _export_response(BATCH_COLUMNS, batch_records(sources), "部材リスト",
+                            element_count_bucket(sum(upload.element_count for upload in uploads)))
+
+@bp.route('/batches/<int:batch_id>/summary')
+@login_required
+def batch_summary(batch_id):
+    """バッチの完了済みのファイルを合算した部材種別×断面性能ごとの集計"""
+    batch = _get_own_batch(batch_id)
+    uploads = _batch_uploads(batch)
+    with stage('summary', element_count_bucket(sum(upload.element_count for upload in uploads))):
+        rows = merge_summaries(summarize_elements(upload) for upload in uploads)
+    return _summary_response(rows, batch.name, url_for('ifc.batch_status', batch_id=batch.id),
+                             'ifc.batch_summary', {'batch_id': batch.id})
+
+def _get_own_chunked_upload(token):
+    upload = db.session.get(ChunkedUpload, token)
+    if upload is None or upload.user_id != current_user.id:
+        abort(404)
+    return upload
+
+def _discard_chunked_upload(upload):
+    _remove_file(upload.filepath)
+    db.session.delete(upload)
+    db.session.commit()
+
+def _chunked_upload_gone(upload):
+    """受信済みの一時ファイルが失われた分割アップロードを削除し、最初から送信し直すよう返す"""
+    logger.warning(f"分割アップロード {upload.token} の一時ファイルが見つかりません")
+    _discard_chunked_upload(upload)
+    return jsonify({'error': '受信済みのデータが見つかりません。もう一度最初からアップロードしてください'}), 410
+
+def _cleanup_stale_uploads():
+    """再開されないまま期限を過ぎた分割アップロードを削除する"""
+    expires = datetime.utcnow() - timedelta(seconds=current_app.config['CHUNKED_UPLOAD_TTL'])
+    for upload in ChunkedUpload.query.filter(ChunkedUpload.updated_at < expires).all():
+        logger.debug(f"期限切れの分割アップロードを削除します: {upload.token}")
+        _discard_chunked_upload(upload)
+
+@bp.route('/uploads', methods=['POST'])
+@login_required
+def create_chunked_upload():
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    size = data.get('size')
+
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': '無効なファイル形式です。IFCファイルをアップロードしてください。'}), 400
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({'error': 'ファイルサイズが不正です'}), 400
+    max_size = current_app.config['MAX_IFC_FILE_SIZE']
+    if size > max_size:
+        return jsonify({'error': f"ファイルサイズは{max_size // (1024 * 1024)}MB以下にしてください"}), 413
+
+    _cleanup_stale_uploads()
+
+    upload = ChunkedUpload(
+        token=uuid.uuid4().hex,
+        filename=filename,
+        filepath=_new_upload_path(filename),
+        total_size=size,
+        user_id=current_user.id
+    )
+    db.session.add(upload)
+    db.session.commit()
+
+    data = upload.to_dict()
+    data['chunk_size'] = current_app.config['UPLOAD_CHUNK_SIZE']
+    return jsonify(data), 201
+
+@bp.route('/uploads/<token>', methods=['GET'])
+@login_required
+def chunked_upload_status(token):
+    return jsonify(_get_own_chunked_upload(token).to_dict())
+
+@bp.route('/uploads/<token>', methods=['PUT'])
+@login_required
+def upload_chunk(token):
+    upload = _get_own_chunked_upload(token)
+    offset = request.args.get('offset', type=int)
+    if offset != upload.received:
+        # クライアントは返された位置から送信し直す
+        data = upload.to_dict()
+        data['error'] = '送信位置が一致しません'
+        return jsonify(data), 409
+
+    if offset > 0 and not os.path.exists(upload.filepath):
+        return _chunked_upload_gone(upload)
+
+    stream = StreamingUpload(upload.filepath, current_app.config['MAX_IFC_FILE_SIZE'], offset=offset,
+                             expected_size=upload.total_size)
+    try:
+        with stage('receive_chunk', file_size_bucket(upload.total_size)):
+            stream.write_stream(request.stream)
+    except UploadRejected as e:
+        _discard_chunked_upload(upload)
+        return jsonify({'error': str(e)}), e.status_code
+
+    upload.received = stream.offset
+    upload.updated_at = datetime.utcnow()
+    db.session.commit()
+    return jsonify(upload.to_dict())
+
+@bp.route('/uploads/<token>/complete', methods=['POST'])
+@login_required
+def complete_chunked_upload(token):
+    upload = _get_own_chunked_upload(token)
+    if upload.received != upload.total_size:
+        data = upload.to_dict()
+        data['error'] = 'ファイルの送信が完了していません'
+        return jsonify(data), 409
+
+    if not os.path.exists(upload.filepath):
+        return _chunked_upload_gone(upload)
+    # 送信は複数のリクエスト（別のワーカーの場合もある）に分かれるため、ハッシュは完了時に計算する
+    file_hash = hash_file(upload.filepath).hexdigest()
+
+    filename, filepath = upload.filename, upload.filepath
+    db.session.delete(upload)
+    db.session.commit()
+
+    try:
+        redirect_url = _start_processing(filename, filepath, file_hash)
+    except UploadRejected as e:
+        _remove_file(filepath)
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"ファイル処理エラー: {str(e)}")
+        db.session.rollback()
+        _remove_file(filepath)
+        return jsonify({'error': f"ファイルの処理中にエラーが発生しました: {str(e)}"}), 500
+    return jsonify({'redirect_url': redirect_url})
+
+def _get_own_job(job_id):
+    job = ParseJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        abort(404)
+    return job
+
+@bp.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = _get_own_job(job_id)
+    if job.status == ParseJob.STATUS_DONE:
+        return redirect(url_for('ifc.preview', upload_id=job.upload_id))
+    return render_template('ifc/job.html', job=job)
+
+def _job_data(job):
+    data = job.to_dict()
+    if job.status == ParseJob.STATUS_DONE:
+        data['preview_url'] = url_for('ifc.preview', upload_id=job.upload_id)
+    return data
+
+@bp.route('/jobs/<int:job_id>/status')
+@login_required
+def job_status_api(job_id):
+    return jsonify(_job_data(_get_own_job(job_id)))
+
+@bp.route('/jobs/<int:job_id>/events')
+@login_required
+def job_events(job_id):
+    """
+    解析の進捗をServer-Sent Eventsで送信する
+
+    状態が変わるたびに送信し、完了・失敗したら接続を閉じる。接続中はWebワーカーの
+    スレッドを占有するため、JOB_EVENTS_TIMEOUT 秒で閉じてブラウザに再接続させる（retry）。
+    同時接続数が JOB_EVENTS_MAX_STREAMS を超える場合は503を返し、ブラウザはポーリングに切り替える。
+    """
+    _get_own_job(job_id)
+    poll_interval = current_app.config['JOB_EVENTS_POLL_INTERVAL']
+    timeout = current_app.config['JOB_EVENTS_TIMEOUT']
+
+    global _event_streams
+    with _event_streams_lock:
+        if _event_streams is None:
+            _event_streams = threading.BoundedSemaphore(current_app.config['JOB_EVENTS_MAX_STREAMS'])
+    if not _event_streams.acquire(blocking=False):
+        return jsonify({'error': '進捗の通知の接続数が上限に達しています'}), 503
+
+    def events():
+        # 接続が閉じたら、この間隔の後にブラウザが再接続する
+        yield f"retry: {int(poll_interval * 1000)}\n\n"
+        last = None
+        last_sent = started = time.monotonic()
+        while time.monotonic() - started < timeout:
+            job = db.session.get(ParseJob, job_id)
+            data = _job_data(job)
+            finished = job.is_finished
+            # 待機中にDBの接続やロックを保持しないよう、読み込みごとにトランザクションを終える
+            db.session.rollback()
+            if data != last:
+                yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+                last = data
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= 15:
+                # プロキシに切断されないよう定期的にコメントを送る
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            if finished:
+                return
+            time.sleep(poll_interval)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    response = Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
+    # 送信を終えた（またはクライアントが切断した）ときに接続数の枠を返す
+    response.call_on_close(_event_streams.release)
+    return response
+
 @bp.route('/preview/<int:upload_id>')
 @login_required
 def preview(upload_id):
     upload = UploadHistory.query.get_or_404(upload_id)
+    if not upload.complete:
+        abort(404)
     if upload.user_id != current_user.id:
         flash('アクセス権限がありません', 'error')
         return redirect(url_for('ifc.index'))
-    elements = json.loads(upload.processed_data)
-    return render_template('ifc/preview.html', upload=upload, elements=elements)
+    with stage('preview_render', element_count_bucket(upload.element_count)):
+        return render_template('ifc/preview.html', upload=upload)
+
+@bp.route('/api/uploads/<int:upload_id>/elements')
+@login_required
+def api_elements(upload_id):
+    upload = UploadHistory.query.get_or_404(upload_id)
+    if upload.user_id != current_user.id or not upload.complete:
+        abort(404)
+
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    try:
+        with stage('preview_query', element_count_bucket(upload.element_count)):
+            total, elements = query_elements(
+                upload,
+                offset=offset,
+                limit=limit,
+                sort=request.args.get('sort') or None,
+                filter_text=request.args.get('filter') or None
+            )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'elements': elements,
+    })
 
 @bp.route('/download/<int:upload_id>')
 @login_required
-def download_csv(upload_id):
+def download_elements(upload_id):
+    """要素の一覧を返す（?format= で形式を指定、既定はCSV）"""
     upload = UploadHistory.query.get_or_404(upload_id)
+    if not upload.complete:
+        abort(404)
     if upload.user_id != current_user.id:
         flash('アクセス権限がありません', 'error')
         return redirect(url_for('ifc.index'))
 
-    elements = json.loads(upload.processed_data)
-    csv_filename = generate_csv_filename()
-    csv_path = os.path.join(current_app.config['UPLOAD_FOLDER'], csv_filename)
+    return _export_response(ELEMENT_COLUMNS, element_records(iter_upload_elements(upload)), "部材リスト",
+                            element_count_bucket(upload.element_count))
 
-    generate_csv(elements, csv_path)
+def _requested_export_format(default=None):
+    """
+    ?format= で指定された出力形式（指定がなければdefault）
 
-    return send_file(
-        csv_path,
-        as_attachment=True,
-        download_name=csv_filename,
-        mimetype='text/csv'
-    )
+    Raises:
+        ValueError: 不明な形式、またはこの環境で出力できない形式の場合
+    """
+    name = request.args.get('format') or default
+    return get_export_format(name) if name else None
+
+def _export_response(columns, records, prefix, size_bucket, export_format=None, filename=None, stage_name=None):
+    """
+    行を ?format= で指定された形式で送信するレスポンス
+
+    テキスト形式はブラウザが対応していればgzip圧縮する。
+
+    Args:
+        columns (tuple): 列の定義（exporters.Column）
+        records (iterable): 各行の値のリスト
+        prefix (str): ファイル名の接頭辞（filenameを指定しない場合）
+        size_bucket (str): 計測の区分
+        export_format (ExportFormat): 出力形式（Noneなら ?format= の形式、既定はCSV）
+        filename (str): ファイル名（拡張子を除く）
+        stage_name (str): 計測の段階名（Noneなら「<形式>_stream」）
+    """
+    if export_format is None:
+        try:
+            export_format = _requested_export_format('csv')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    name = f"{filename}.{export_format.extension}" if filename \
+        else generate_export_filename(prefix, export_format.extension)
+    chunks = timed_iter(export_format.writer(columns, records), stage_name or f"{export_format.name}_stream",
+                        size_bucket)
+    headers = {'Content-Disposition': _attachment_header(name)}
+    if export_format.compressible:
+        headers['Vary'] = 'Accept-Encoding'
+        if current_app.config['CSV_GZIP'] and 'gzip' in request.accept_encodings:
+            chunks = gzip_chunks(chunks)
+            headers['Content-Encoding'] = 'gzip'
+
+    return Response(stream_with_context(chunks), mimetype=export_format.mimetype, headers=headers)
+
+@bp.context_processor
+def _inject_export_formats():
+    return {'export_formats': available_formats()}
+
+@bp.route('/summary/<int:upload_id>')
+@login_required
+def summary(upload_id):
+    """部材種別×断面性能ごとの本数・長さ・重量の集計"""
+    upload = UploadHistory.query.get_or_404(upload_id)
+    if not upload.complete:
+        abort(404)
+    if upload.user_id != current_user.id:
+        flash('アクセス権限がありません', 'error')
+        return redirect(url_for('ifc.index'))
+
+    with stage('summary', element_count_bucket(upload.element_count)):
+        rows = summarize_elements(upload)
+    return _summary_response(rows, upload.filename, url_for('ifc.preview', upload_id=upload.id),
+                             'ifc.summary', {'upload_id': upload.id})
+
+def _summary_response(rows, title, back_url, export_endpoint, export_args):
+    """集計を表示する（?format= を指定した場合はその形式で返す）"""
+    try:
+        export_format = _requested_export_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if export_format is not None:
+        return _export_response(SUMMARY_COLUMNS, summary_records(rows), "部材集計", 'unknown', export_format)
+    totals = {
+        'count': sum(row.count for row in rows),
+        'length': sum(row.length or 0 for row in rows),
+        'weight': sum(row.weight or 0 for row in rows),
+    }
+    return render_template('ifc/summary.html', title=title, back_url=back_url, export_endpoint=export_endpoint,
+                           export_args=export_args, rows=rows, totals=totals)
+
+@bp.route('/diff/<int:upload_id>')
+@login_required
+def diff(upload_id):
+    """
+    前の版（または ?base= で指定した履歴）との要素の差分を表示する（?format= で全件をその形式で出力）
+    """
+    # 差分はストリーミング中にも読み込むため、旧形式のJSONも先に読み込んでおく
+    query = UploadHistory.query.options(db.undefer(UploadHistory.processed_data))
+    upload = query.get_or_404(upload_id)
+    if not upload.complete:
+        abort(404)
+    if upload.user_id != current_user.id:
+        flash('アクセス権限がありません', 'error')
+        return redirect(url_for('ifc.index'))
+
+    base = None
+    base_id = request.args.get('base', type=int) or upload.parent_id
+    if base_id is not None:
+        base = query.get_or_404(base_id)
+        if base.user_id != current_user.id or not base.complete:
+            abort(404)
+
+    try:
+        export_format = _requested_export_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # GlobalIdのない履歴（旧形式）は要素を対応付けられないため、差分なしとせずエラーにする
+    status = 200
+    if base is not None:
+        missing = [history.filename for history in (base, upload) if not has_global_ids(history)]
+        if missing:
+            message = (f"GlobalIdが記録されていない履歴（{'、'.join(missing)}）は比較できません。"
+                       f"IFCファイルをもう一度アップロードしてください")
+            if export_format is not None:
+                return jsonify({'error': message}), 400
+            flash(message, 'error')
+            base = None
+            status = 400
+
+    if base is not None and export_format is not None:
+        filename = f"差分_{os.path.splitext(base.filename)[0]}_{base.id}_{upload.id}"
+        return _export_response(DIFF_COLUMNS, diff_records(iter_diff(base, upload)), None,
+                                element_count_bucket(upload.element_count), export_format, filename, 'diff_stream')
+
+    counts = {DIFF_ADDED: 0, DIFF_REMOVED: 0, DIFF_CHANGED: 0}
+    rows = []
+    if base is not None:
+        with stage('diff', element_count_bucket(upload.element_count)):
+            for row in iter_diff(base, upload):
+                counts[row.status] += 1
+                if len(rows) < DIFF_DISPLAY_LIMIT:
+                    rows.append(row)
+
+    choices = db.session.query(UploadHistory.id, UploadHistory.filename, UploadHistory.processed_date)\
+        .filter(UploadHistory.user_id == current_user.id, UploadHistory.complete.is_(True),
+                UploadHistory.id != upload.id)\
+        .order_by(UploadHistory.processed_date.desc(), UploadHistory.id.desc())\
+        .limit(DIFF_BASE_CHOICES).all()
+    return render_template('ifc/diff.html', upload=upload, base=base, rows=rows, counts=counts,
+                           choices=choices, display_limit=DIFF_DISPLAY_LIMIT), status
+
+@bp.route('/profile/<int:upload_id>')
+@login_required
+def download_profile(upload_id):
+    """解析時に取得したプロファイルをpstatsまたはspeedscope形式で返す"""
+    upload = UploadHistory.query.get_or_404(upload_id)
+    if upload.user_id != current_user.id or not upload.profile_path \
+            or not os.path.exists(upload.profile_path):
+        abort(404)
+
+    basename = f"{os.path.splitext(upload.filename)[0]}_{upload.id}"
+    output_format = request.args.get('format', 'pstats')
+    if output_format == 'pstats':
+        return send_file(upload.profile_path, mimetype='application/octet-stream',
+                         as_attachment=True, download_name=f"{basename}.prof")
+    if output_format == 'speedscope':
+        data = pstats_to_speedscope(upload.profile_path, name=upload.filename)
+        response = jsonify(data)
+        response.headers['Content-Disposition'] = _attachment_header(f"{basename}.speedscope.json")
+        return response
+    return jsonify({'error': f"不明な形式です: {output_format}"}), 400
+
+def _attachment_header(filename):
+    """日本語のファイル名にも対応したContent-Dispositionを作成する"""
+    fallback = secure_filename(filename) or 'download.csv'
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
 
 @bp.route('/history')
 @login_required
 def history():
-    uploads = UploadHistory.query.filter_by(user_id=current_user.id)\
-        .order_by(UploadHistory.processed_date.desc()).all()
-    return render_template('ifc/history.html', uploads=uploads)
\ No newline at end of file
+    before = request.args.get('before', type=int)
+    page_size = current_app.config['HISTORY_PAGE_SIZE']
+    uploads, next_before = _history_page(current_user.id, before, page_size)
+    return render_template('ifc/history.html', uploads=uploads, before=before, next_before=next_before)
+
+def _history_page(user_id, before, page_size):
+    """
+    変換履歴の1ページを新しい順に取得する（キーセット方式）
+
+    Args:
+        user_id (int): ユーザーID
+        before (int): 前のページの最後の履歴ID（Noneなら最初のページ）
+        page_size (int): 1ページの件数
+
+    Returns:
+        tuple: (一覧に表示する列の行のリスト, 次のページのbefore（なければNone）)
+    """
+    # 旧形式のprocessed_dataなど大きな列は読み込まない
+    query = db.session.query(
+        UploadHistory.id, UploadHistory.filename, UploadHistory.processed_date, UploadHistory.element_count
+    ).filter(UploadHistory.user_id == user_id, UploadHistory.complete.is_(True))
+    if before is not None:
+        anchor = db.session.query(UploadHistory.processed_date)\
+            .filter_by(id=before, user_id=user_id).scalar()
+        if anchor is not None:
+            query = query.filter(db.or_(
+                UploadHistory.processed_date < anchor,
+                db.and_(UploadHistory.processed_date == anchor, UploadHistory.id < before),
+            ))
+    rows = query.order_by(UploadHistory.processed_date.desc(), UploadHistory.id.desc())\
+        .limit(page_size + 1).all()
+    next_before = rows[page_size - 1].id if len(rows) > page_size else None
+    return rows[:page_size], next_before
\ No newline at end of file
@@ -0,0 +1,438 @@
+import os
+import time
+import logging
+import multiprocessing
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.orm import aliased
+from .db import db
+from .models import ParseJob, UploadHistory
+from .results import record_upload, discard_upload
+from .metrics import stage, file_size_bucket
+from .utils.parse_cache import ParseCache
+from .utils.extraction_spec import select_types
+from .utils.profiling import profile_call
+from .utils.step_scan import ScanError, scan_file, target_count, is_supported_schema
+from .utils.upload_stream import UploadRejected
+
+logger = logging.getLogger(__name__)
+
+# ワーカープロセス内で使用するアプリケーション
+_worker_app = None
+
+# gunicornワーカーごとのプロセスプールと、それを作成したアプリ（ワーカーの異常終了時の後処理に使う）
+_executor = None
+_executor_app = None
+_executor_lock = threading.Lock()
+
+# 推定メモリの上限を超えるため待機中のジョブが、実行できるか確認し直す間隔（秒）
+MEMORY_WAIT_INTERVAL = 1.0
+# この時間より前に開始した実行中のジョブは、異常終了したものとして推定メモリに数えない
+MEMORY_STALE_AFTER = timedelta(hours=6)
+
+_MIB = 1024 * 1024
+
+
+def init_app(app, config_class):
+    """ワーカープロセスでアプリを再構築するために設定クラスを記録する"""
+    app.extensions['ifc_jobs'] = {'config_class': config_class}
+
+
+def _init_worker(config_class):
+    """プロセスプールの各ワーカーで一度だけアプリを生成する"""
+    global _worker_app
+    from . import create_app
+    _worker_app = create_app(config_class)
+
+
+def _get_executor(app):
+    global _executor, _executor_app
+    with _executor_lock:
+        if _executor is None:
+            _executor_app = app
+            config_class = app.extensions['ifc_jobs']['config_class']
+            _executor = ProcessPoolExecutor(
+                max_workers=app.config['PARSE_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(config_class,)
+            )
+            logger.info(f"解析ワーカーを起動しました (workers={app.config['PARSE_WORKERS']})")
+            _requeue_pending_jobs(_executor)
+        return _executor
+
+
+def _requeue_pending_jobs(executor):
+    """前回のプロセス終了時に取り残されたジョブを再投入する"""
+    pending = ParseJob.query.filter_by(status=ParseJob.STATUS_QUEUED)\
+        .order_by(ParseJob.id).all()
+    for job in pending:
+        _submit(executor, job.id)
+    if pending:
+        logger.info(f"{len(pending)} 件の待機中ジョブを再投入しました")
+
+
+def _submit(executor, job_id):
+    future = executor.submit(run_parse_job, job_id)
+    future.add_done_callback(lambda f: _log_failure(executor, job_id, f))
+
+
+def _log_failure(executor, job_id, future):
+    exc = future.exception()
+    if isinstance(exc, BrokenProcessPool):
+        _recover_broken_pool(executor, job_id)
+    elif exc is not None:
+        logger.error(f"ジョブ {job_id} のワーカーでエラーが発生: {str(exc)}")
+
+
+def _discard_executor(executor):
+    """壊れたプロセスプールを破棄する（次のジョブの投入時に作り直す）"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _recover_broken_pool(executor, job_id):
+    """
+    ワーカープロセスの異常終了（メモリ不足による強制終了など）でプールが壊れた場合の後処理
+
+    プールは破棄して作り直す。実行中だったジョブは原因の可能性があるため失敗とし、
+    待機中だったジョブは新しいプールへ再投入する（_requeue_pending_jobs）。
+    """
+    _discard_executor(executor)
+    with _executor_app.app_context():
+        job = db.session.get(ParseJob, job_id)
+        if job is None:
+            return
+        if job.status == ParseJob.STATUS_RUNNING:
+            logger.error(f"ジョブ {job_id} の実行中に解析ワーカーが異常終了しました")
+            _discard_partial_upload(job)
+            job.status = ParseJob.STATUS_FAILED
+            job.error = '解析ワーカーが異常終了しました（メモリ不足の可能性があります）'
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            if os.path.exists(job.filepath):
+                os.remove(job.filepath)
+        elif job.status == ParseJob.STATUS_QUEUED:
+            _get_executor(_executor_app)
+
+
+def get_parse_cache():
+    """現在のアプリ設定に基づく解析結果キャッシュを返す"""
+    return ParseCache(current_app.config['PARSE_CACHE_DIR'],
+                      current_app.config['PARSE_CACHE_MAX_BYTES'])
+
+
+def get_extraction_spec():
+    """設定（EXTRACTION_TYPES）で絞り込んだ抽出仕様を返す"""
+    return select_types(current_app.config['EXTRACTION_TYPES'])
+
+
+def get_geometry_options():
+    """形状から数量を求める設定（GEOMETRY_QUANTITIESが無効ならNone）"""
+    if not current_app.config['GEOMETRY_QUANTITIES']:
+        return None
+    from .utils.geometry import GeometryOptions, DEFAULT_TYPES
+    return GeometryOptions(
+        types=tuple(current_app.config['GEOMETRY_TYPES'] or DEFAULT_TYPES),
+        threads=current_app.config['GEOMETRY_THREADS'],
+        default_density=current_app.config['GEOMETRY_DEFAULT_DENSITY'] or None,
+    )
+
+
+def estimate_memory(scan):
+    """事前走査したエンティティ数から解析に使うメモリを推定する（バイト）"""
+    return sum(scan.entity_counts.values()) * current_app.config['PARSE_MEMORY_PER_ENTITY']
+
+
+def prescan_upload(filepath):
+    """
+    モデルを読み込む前にファイルを事前走査し、解析できないファイルを拒否する
+
+    対応していないスキーマのファイル、抽出対象の要素を含まないファイル、推定メモリが
+    PARSE_MEMORY_LIMIT を超えるファイルは受け付けない。
+
+    Args:
+        filepath (str): 保存済みIFCファイルのパス
+
+    Returns:
+        ScanResult: 事前走査の結果
+
+    Raises:
+        UploadRejected: 受け付けられないファイルの場合
+    """
+    try:
+        scan = scan_file(filepath)
+    except ScanError as e:
+        raise UploadRejected(f"IFCファイルとして読み取れません: {str(e)}")
+
+    supported = current_app.config['SUPPORTED_SCHEMAS']
+    if supported and not is_supported_schema(scan.schema, supported):
+        raise UploadRejected(
+            f"対応していないIFCスキーマです: {scan.schema or '不明'}（対応: {', '.join(supported)}）")
+
+    spec = get_extraction_spec()
+    if target_count(scan.entity_counts, spec) == 0:
+        raise UploadRejected(f"抽出対象の要素（{', '.join(spec)}）が含まれていません")
+
+    limit = current_app.config['PARSE_MEMORY_LIMIT']
+    estimate = estimate_memory(scan)
+    if limit and estimate > limit:
+        raise UploadRejected(
+            f"モデルが大きすぎるため解析できません（推定メモリ {estimate // _MIB}MB、上限 {limit // _MIB}MB）", 413)
+    logger.debug(f"事前走査: {scan.schema} {sum(scan.entity_counts.values())} エンティティ "
+                 f"({scan.originating_system})")
+    return scan
+
+
+def cache_key_for(file_hash):
+    from .utils.ifc_parser import cache_version
+    return ParseCache.make_key(file_hash, cache_version(get_extraction_spec(), get_geometry_options()))
+
+
+def enqueue_parse_job(filename, filepath, user_id, file_hash=None, profile=False, batch_id=None, scan=None):
+    """
+    解析ジョブを登録してワーカーに投入する
+
+    Args:
+        filename (str): 元のファイル名
+        filepath (str): 保存済みIFCファイルのパス
+        user_id (int): アップロードしたユーザーのID
+        file_hash (str): ファイル内容のSHA-256（解析結果をキャッシュする場合）
+        profile (bool): 解析をプロファイラの下で実行する
+        batch_id (int): 一括アップロードのバッチID
+        scan (ScanResult): 事前走査の結果（進捗の表示と推定メモリによる実行の制御に使う）
+
+    Returns:
+        ParseJob: 登録したジョブ
+    """
+    # プール起動時の再投入と重複しないよう、先にプールを取得する
+    executor = _get_executor(current_app._get_current_object())
+
+    job = ParseJob(filename=filename, filepath=filepath, user_id=user_id, file_hash=file_hash,
+                   profile=profile, batch_id=batch_id)
+    if scan is not None:
+        job.schema = scan.schema
+        job.entity_count = sum(scan.entity_counts.values())
+        job.target_count = target_count(scan.entity_counts, get_extraction_spec())
+        job.memory_estimate = estimate_memory(scan)
+    db.session.add(job)
+    db.session.commit()
+
+    try:
+        _submit(executor, job.id)
+    except BrokenProcessPool:
+        # 作り直したプールが待機中のジョブとして投入する
+        logger.warning("解析ワーカーのプールが壊れているため作り直します")
+        _discard_executor(executor)
+        _get_executor(current_app._get_current_object())
+    except Exception as e:
+        # 投入できなかったジョブを待機中のまま残さない（ファイルは呼び出し側で削除する）
+        job.status = ParseJob.STATUS_FAILED
+        job.error = f"解析ジョブを開始できませんでした: {str(e)}"
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        raise
+    logger.debug(f"ジョブ {job.id} を投入しました: {filename}")
+    return job
+
+
+def _claim_job(job_id):
+    """
+    待機中のジョブを実行中に更新する（他のワーカーが取得済みならFalse）
+
+    PARSE_MEMORY_LIMIT を設定した場合、実行中のジョブの推定メモリとの合計が上限を超える間は
+    待機する（実行中のジョブがなければ上限に関わらず実行する）。判定と更新は1つのUPDATEで行うため、
+    複数のワーカーが同時に上限を超えて実行を始めることはない。
+    """
+    conditions = [ParseJob.id == job_id, ParseJob.status == ParseJob.STATUS_QUEUED]
+    limit = current_app.config['PARSE_MEMORY_LIMIT']
+    if limit:
+        running = aliased(ParseJob)
+        active = db.and_(running.status == ParseJob.STATUS_RUNNING,
+                         running.started_at > datetime.utcnow() - MEMORY_STALE_AFTER)
+        used = db.select(db.func.coalesce(db.func.sum(running.memory_estimate), 0))\
+            .where(active).scalar_subquery()
+        conditions.append(db.or_(
+            ParseJob.memory_estimate.is_(None),
+            ~db.exists().where(active),
+            used + ParseJob.memory_estimate <= limit,
+        ))
+
+    while True:
+        result = db.session.execute(
+            db.update(ParseJob)
+            .where(*conditions)
+            .values(status=ParseJob.STATUS_RUNNING, started_at=datetime.utcnow())
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            return True
+
+        job = db.session.execute(
+            db.select(ParseJob.status, ParseJob.stage).where(ParseJob.id == job_id)
+        ).one_or_none()
+        if job is None or job.status != ParseJob.STATUS_QUEUED:
+            return False
+        if job.stage != 'memory_wait':
+            db.session.execute(db.update(ParseJob).where(ParseJob.id == job_id).values(stage='memory_wait'))
+            db.session.commit()
+            logger.info(f"ジョブ {job_id} は推定メモリが上限を超えるため待機します")
+        time.sleep(MEMORY_WAIT_INTERVAL)
+
+
+def _set_job_upload(job_id, upload_id):
+    db.session.execute(db.update(ParseJob).where(ParseJob.id == job_id).values(upload_id=upload_id))
+    db.session.commit()
+
+
+def _record_job_upload(job, rows):
+    """
+    解析結果を少しずつ履歴に保存する
+
+    保存中の履歴は作成した時点でジョブに記録し、ワーカーが異常終了した場合に
+    _recover_broken_pool が削除できるようにする。保存に失敗した場合は
+    record_upload が保存途中の履歴を削除するため、記録も消す。
+    """
+    try:
+        return record_upload(job.filename, job.user_id, rows, incremental=True, batch_id=job.batch_id,
+                             created=lambda upload_id: _set_job_upload(job.id, upload_id))
+    except Exception:
+        _set_job_upload(job.id, None)
+        raise
+
+
+def _discard_partial_upload(job):
+    """ジョブが保存途中だった履歴（要素・列指向ファイルを含む）を削除する（完了した履歴は残す）"""
+    if job.upload_id is None:
+        return
+    history = db.session.get(UploadHistory, job.upload_id)
+    if history is not None and not history.complete:
+        logger.info(f"ジョブ {job.id} の保存途中の履歴 {job.upload_id} を削除します")
+        discard_upload(job.upload_id)
+    job.upload_id = None
+
+
+class _ProgressReporter:
+    """解析の進捗を一定間隔でジョブに書き込む（段階が変わったときと完了時は必ず書き込む）"""
+
+    def __init__(self, job_id, interval):
+        self.job_id = job_id
+        self.interval = interval
+        self._stage = None
+        self._last = 0.0
+
+    def __call__(self, stage, done, total):
+        now = time.monotonic()
+        if stage == self._stage and done != total and now - self._last < self.interval:
+            return
+        self._stage = stage
+        self._last = now
+        db.session.execute(
+            db.update(ParseJob)
+            .where(ParseJob.id == self.job_id)
+            .values(stage=stage, progress_done=done, progress_total=total)
+        )
+        db.session.commit()
+
+
+def _store_parse_result(job, parse_args):
+    """
+    解析しながら結果を履歴に保存し、同時に解析結果キャッシュへ書き込む
+
+    解析結果はバッチ単位で受け取ってすぐに保存するため、全件をメモリに保持しない。
+    """
+    from .utils.ifc_parser import iter_elements
+
+    batches = iter_elements(job.filepath, **parse_args)
+    cache_writer = get_parse_cache().writer(cache_key_for(job.file_hash)) if job.file_hash else nullcontext()
+    with cache_writer as writer:
+        def rows():
+            for batch in batches:
+                if writer is not None:
+                    writer.write(batch)
+                yield from batch
+        return _record_job_upload(job, rows())
+
+
+def _store_cached_result(job, progress):
+    """
+    解析結果キャッシュから履歴を作成する
+
+    キャッシュがない場合・読み込み途中で破損が分かった場合はNoneを返す
+    （保存途中の履歴と要素・列指向ファイルはrecord_uploadが削除する）。
+    """
+    rows = get_parse_cache().get(cache_key_for(job.file_hash))
+    if rows is None:
+        return None
+    progress('cached', None, None)
+    try:
+        return _record_job_upload(job, rows)
+    except (OSError, ValueError, TypeError) as e:
+        logger.warning(f"ジョブ {job.id} のキャッシュを使用できないため解析します: {str(e)}")
+        return None
+
+
+def run_parse_job(job_id):
+    """ワーカープロセスでIFCファイルを解析し、結果を履歴に保存する"""
+    with _worker_app.app_context():
+        if not _claim_job(job_id):
+            logger.debug(f"ジョブ {job_id} は既に処理されています")
+            return
+
+        job = db.session.get(ParseJob, job_id)
+        bucket = file_size_bucket(os.path.getsize(job.filepath) if os.path.exists(job.filepath) else None)
+        progress = _ProgressReporter(job_id, current_app.config['JOB_PROGRESS_INTERVAL'])
+        try:
+            parse_args = dict(workers=current_app.config['PARSE_EXTRACT_WORKERS'],
+                              spec=get_extraction_spec(),
+                              geometry=get_geometry_options(),
+                              stage=lambda name: stage(name, bucket),
+                              progress=progress)
+
+            # 同じ内容のファイルが解析済みならキャッシュから保存する（プロファイル時は実際に解析する）
+            history = None
+            if job.file_hash and not job.profile:
+                with stage('persist_cached', bucket):
+                    history = _store_cached_result(job, progress)
+
+            # 解析と保存は交互に行うため、まとめて1つの段階として計測する
+            if history is None:
+                with stage('extract_persist', bucket):
+                    if job.profile:
+                        # 抽出処理の内訳が見えるよう、プロファイル時は単一プロセスで解析する
+                        profile_path = os.path.join(current_app.config['PROFILE_DIR'], f"job-{job.id}.prof")
+                        parse_args['workers'] = None
+                        history = profile_call(profile_path, _store_parse_result, job, parse_args)
+                        history.profile_path = profile_path
+                    else:
+                        history = _store_parse_result(job, parse_args)
+
+            progress('persist', None, None)
+            job = db.session.get(ParseJob, job_id)
+            job.upload_id = history.id
+            job.status = ParseJob.STATUS_DONE
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            logger.info(f"ジョブ {job_id} が完了しました ({history.element_count} 要素)")
+
+        except Exception as e:
+            logger.error(f"ジョブ {job_id} の処理中にエラーが発生: {str(e)}")
+            db.session.rollback()
+            job = db.session.get(ParseJob, job_id)
+            _discard_partial_upload(job)
+            job.status = ParseJob.STATUS_FAILED
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+
+        finally:
+            # 一時ファイルを削除
+            if os.path.exists(job.filepath):
+                os.remove(job.filepath)
@@ -0,0 +1,314 @@
+"""
+処理段階ごとの計測とPrometheus形式での公開
+
+各段階の処理時間とメモリ増加量をヒストグラムとして記録する。
+gunicornの各ワーカーと解析ワーカーは別プロセスのため、計測値は
+プロセスごとに METRICS_DIR へ書き出し、/metrics で合算して返す。
+終了したプロセスのファイルは、アプリの起動時とgunicornのワーカー終了時（child_exit）に削除する。
+"""
+import os
+import json
+import time
+import uuid
+import atexit
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from flask import Blueprint, Response, current_app, request, abort
+
+logger = logging.getLogger(__name__)
+bp = Blueprint('metrics', __name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 4, 16, 64, 256, 512, 1024, 2048, 4096))
+
+_MIB = 1024 * 1024
+
+# 計測値をファイルに書き出す最小間隔（秒、プロセス終了時にも書き出す）
+FLUSH_INTERVAL = 1.0
+
+# tracemallocの最大割り当て量はプロセス全体で1つのため、同時に計測できる段階は1つだけとする
+# （最も外側の段階を1つのスレッドだけが計測する。入れ子の段階・他のスレッドの段階はRSSで計測する。
+# 計測中の段階の値には、同時に実行中の他のスレッドの割り当ても含まれる）
+_trace_lock = threading.Lock()
+_trace_local = threading.local()
+
+
+def file_size_bucket(size):
+    """ファイルサイズの区分（アップロード・解析の段階に使う）"""
+    if size is None:
+        return 'unknown'
+    for limit, label in ((_MIB, 'file_lt_1mb'), (10 * _MIB, 'file_lt_10mb'), (100 * _MIB, 'file_lt_100mb')):
+        if size < limit:
+            return label
+    return 'file_ge_100mb'
+
+
+def element_count_bucket(count):
+    """要素数の区分（プレビュー・ダウンロードの段階に使う）"""
+    if count is None:
+        return 'unknown'
+    for limit, label in ((1000, 'elements_lt_1k'), (10000, 'elements_lt_10k'), (100000, 'elements_lt_100k')):
+        if count < limit:
+            return label
+    return 'elements_ge_100k'
+
+
+def _current_rss():
+    """現在のRSS（バイト）。取得できない環境ではNone"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {'counts': self.counts, 'sum': self.sum, 'count': self.count}
+
+
+class MetricsRegistry:
+    """プロセス内の計測値を保持し、ファイルに書き出す"""
+
+    METRICS = {
+        'ifc_stage_duration_seconds': ('処理段階ごとの処理時間', DURATION_BUCKETS),
+        'ifc_stage_memory_bytes': ('処理段階ごとのメモリ増加量（tracemalloc有効時、最も外側の段階はPythonの最大割り当て量）',
+                                   MEMORY_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._directory = None
+        self._path = None
+        self._pid = None
+        self._flushed_at = 0.0
+        self._timer = None
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # 親プロセスのロック・書き出しのタイマーは子プロセスに引き継がない
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def configure(self, directory):
+        self._directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            prune_dead_processes(directory)
+
+    def observe(self, metric, labels, value):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.METRICS[metric][1])
+            histogram.observe(value)
+            due = time.monotonic() - self._flushed_at >= FLUSH_INTERVAL
+            if not due and self._timer is None:
+                # 間隔内の計測値は、次の計測を待たずに間隔の経過後に書き出す
+                self._timer = threading.Timer(FLUSH_INTERVAL, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def flush(self):
+        """計測値をこのプロセス用のファイルに書き出す（書き出し中は他のスレッドの計測・書き出しを待たせる）"""
+        if not self._directory:
+            return
+        with self._lock:
+            # fork後は別ファイルに書き出す
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._path = os.path.join(self._directory, f"metrics-{self._pid}-{uuid.uuid4().hex[:8]}.json")
+            data = [
+                {'metric': metric, 'labels': dict(labels), **histogram.to_dict()}
+                for (metric, labels), histogram in self._histograms.items()
+            ]
+            tmp_path = f"{self._path}.{uuid.uuid4().hex[:8]}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self._path)
+            except OSError as e:
+                logger.warning(f"計測値の書き出しに失敗しました: {str(e)}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self._flushed_at = time.monotonic()
+            self._timer = None
+
+
+def _file_pid(name):
+    """計測値のファイル名（metrics-<pid>-<id>.json[.<id>.tmp]）からプロセスIDを取り出す"""
+    parts = name.split('-')
+    if len(parts) < 3 or parts[0] != 'metrics' or not parts[1].isdigit():
+        return None
+    return int(parts[1])
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def prune_dead_processes(directory, pids=None):
+    """
+    終了したプロセスの計測値のファイルを削除する
+
+    Args:
+        directory (str): METRICS_DIR
+        pids (iterable): 削除するプロセスID（Noneなら存在しないプロセスのファイルを全て削除する）
+    """
+    if not directory or not os.path.isdir(directory):
+        return
+    pids = set(pids) if pids is not None else None
+    for entry in os.scandir(directory):
+        pid = _file_pid(entry.name)
+        if pid is None or pid == os.getpid():
+            continue
+        if (pid in pids) if pids is not None else not _pid_alive(pid):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+registry = MetricsRegistry()
+atexit.register(registry.flush)
+
+
+def init_app(app):
+    registry.configure(app.config['METRICS_DIR'])
+    app.register_blueprint(bp)
+
+
+@contextmanager
+def stage(name, size_bucket='unknown'):
+    """
+    処理段階の処理時間とメモリ増加量を記録するコンテキストマネージャ
+
+    METRICS_TRACEMALLOC が有効な場合、他に計測中の段階がなければtracemallocで
+    最大割り当て量を計測する（計測中の段階がある場合はRSSの増加量を記録する）。
+
+        with stage('extract', file_size_bucket(size)):
+            ...
+    """
+    trace = current_app.config.get('METRICS_TRACEMALLOC', False) if current_app else False
+    trace = trace and not getattr(_trace_local, 'active', False) and _trace_lock.acquire(blocking=False)
+    started_trace = False
+    if trace:
+        _trace_local.active = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_trace = True
+        tracemalloc.reset_peak()
+    rss_before = _current_rss()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if trace:
+            memory = tracemalloc.get_traced_memory()[1]
+            if started_trace:
+                tracemalloc.stop()
+            _trace_local.active = False
+            _trace_lock.release()
+        else:
+            rss_after = _current_rss()
+            memory = max(rss_after - rss_before, 0) if rss_before is not None and rss_after is not None else None
+
+        labels = {'stage': name, 'size_bucket': size_bucket}
+        registry.observe('ifc_stage_duration_seconds', labels, elapsed)
+        if memory is not None:
+            registry.observe('ifc_stage_memory_bytes', labels, memory)
+        logger.debug(f"stage {name} ({size_bucket}): {elapsed:.3f}s")
+
+
+def timed_iter(iterable, name, size_bucket='unknown'):
+    """ジェネレータを最後まで読み出すまでの時間を1つの段階として記録する"""
+    with stage(name, size_bucket):
+        yield from iterable
+
+
+def _load_all(directory):
+    """全プロセスの計測値を合算する"""
+    merged = {}
+    if not directory or not os.path.isdir(directory):
+        return merged
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.json'):
+            continue
+        try:
+            with open(entry.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for item in data:
+            key = (item['metric'], tuple(sorted(item['labels'].items())))
+            total = merged.get(key)
+            if total is None:
+                merged[key] = {'counts': list(item['counts']), 'sum': item['sum'], 'count': item['count']}
+            else:
+                total['counts'] = [a + b for a, b in zip(total['counts'], item['counts'])]
+                total['sum'] += item['sum']
+                total['count'] += item['count']
+    return merged
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    return ','.join(f'{key}="{value}"' for key, value in items)
+
+
+def render_prometheus(directory):
+    """合算した計測値をPrometheusのテキスト形式で返す"""
+    merged = _load_all(directory)
+    lines = []
+    for metric, (help_text, buckets) in MetricsRegistry.METRICS.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for (name, labels), values in sorted(merged.items()):
+            if name != metric:
+                continue
+            for upper, count in zip(buckets, values['counts']):
+                lines.append(f"{metric}_bucket{{{_format_labels(labels, [('le', repr(float(upper)))])}}} {count}")
+            lines.append(f"{metric}_bucket{{{_format_labels(labels, [('le', '+Inf')])}}} {values['count']}")
+            lines.append(f"{metric}_sum{{{_format_labels(labels)}}} {values['sum']}")
+            lines.append(f"{metric}_count{{{_format_labels(labels)}}} {values['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+@bp.route('/metrics')
+def metrics():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        if request.headers.get('Authorization') != f"Bearer {token}":
+            abort(403)
+    elif not current_app.config.get('METRICS_PUBLIC'):
+        abort(403)
+    return Response(render_prometheus(current_app.config['METRICS_DIR']),
+                    mimetype='text/plain; version=0.0.4')
@@ -1,8 +1,10 @@
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import hashlib
 import logging
 from .db import db
+from .utils.extraction_spec import UNDEFINED, ElementRow
 
 logger = logging.getLogger(__name__)
 
@@ -25,12 +27,216 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
 class UploadHistory(db.Model):
+    # 要素の保存先（Elementテーブル、または列指向ファイル）
+    STORAGE_SQL = 'sql'
+    STORAGE_COLUMNAR = 'columnar'
+
+    # 履歴一覧（ユーザーごとに新しい順）のためのインデックス
+    __table_args__ = (
+        db.Index('ix_upload_history_user_date', 'user_id', 'processed_date', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     processed_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     element_count = db.Column(db.Integer, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    processed_data = db.Column(db.Text, nullable=True)
+    # 旧形式（要素リストのJSON）。新しい履歴ではElementテーブルに保存する
+    # 大きくなるため、参照したときだけ読み込む
+    processed_data = db.deferred(db.Column(db.Text, nullable=True))
+    # 解析時に取得したプロファイル（pstats形式）のパス
+    profile_path = db.Column(db.String(1024), nullable=True)
+    # 要素を分割して保存している間はFalse（一覧・プレビューに表示しない）
+    complete = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
+    storage = db.Column(db.String(16), nullable=False, default=STORAGE_SQL, server_default=STORAGE_SQL)
+    # 一括アップロードで登録された場合のバッチ
+    batch_id = db.Column(db.Integer, db.ForeignKey('upload_batch.id'), nullable=True, index=True)
+    # 前の版（同じユーザーが同じファイル名で最後に登録した履歴）
+    parent_id = db.Column(db.Integer, db.ForeignKey('upload_history.id'), nullable=True)
 
     def __repr__(self):
         return f'<UploadHistory {self.filename}>'
+
+class UploadBatch(db.Model):
+    """複数ファイル・ZIPの一括アップロード（ファイルごとに解析ジョブと履歴を作成する）"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+    def __repr__(self):
+        return f'<UploadBatch {self.id} {self.name}>'
+
+class ChunkedUpload(db.Model):
+    """分割送信中のアップロード（中断後に続きから再開できる）"""
+    token = db.Column(db.String(32), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    filepath = db.Column(db.String(1024), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+    def to_dict(self):
+        return {
+            'token': self.token,
+            'filename': self.filename,
+            'size': self.total_size,
+            'received': self.received,
+        }
+
+    def __repr__(self):
+        return f'<ChunkedUpload {self.token} {self.received}/{self.total_size}>'
+
+class Element(db.Model):
+    __table_args__ = (
+        # 部材種別×断面性能の集計をテーブルを読まずにインデックスだけで行う
+        db.Index('ix_element_upload_summary', 'upload_id', 'ifc_type', 'size', 'length', 'weight'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    upload_id = db.Column(db.Integer, db.ForeignKey('upload_history.id', ondelete='CASCADE'),
+                          nullable=False, index=True)
+    ifc_type = db.Column(db.String(64), nullable=False)
+    global_id = db.Column(db.String(64), nullable=True)
+    name = db.Column(db.Text, nullable=True)
+    size = db.Column(db.Text, nullable=True)
+    weight = db.Column(db.Float, nullable=True)
+    length = db.Column(db.Float, nullable=True)
+
+    @staticmethod
+    def _to_float(value):
+        if value is None or isinstance(value, bool):
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _to_text(value):
+        if value is None or value == UNDEFINED:
+            return None
+        return str(value)
+
+    @classmethod
+    def insert_values(cls, upload_id, row):
+        """解析結果の行（ElementRow）を一括挿入用の値に変換する"""
+        return {
+            'upload_id': upload_id,
+            'ifc_type': row.type,
+            'global_id': row.global_id,
+            'name': cls._to_text(row.name),
+            'size': cls._to_text(row.size),
+            'weight': cls._to_float(row.weight),
+            'length': cls._to_float(row.length),
+        }
+
+    @staticmethod
+    def row_from_dict(data):
+        """旧形式（JSON）の辞書をElementRowに変換する"""
+        return ElementRow(*(
+            None if data.get(key) == UNDEFINED else data.get(key)
+            for key in ElementRow._fields
+        ))
+
+    @classmethod
+    def normalize_row(cls, row):
+        """ElementRowの値を保存時と同じ型（文字列・数値）にそろえる"""
+        return ElementRow(row.type, row.global_id, cls._to_text(row.name), cls._to_text(row.size),
+                          cls._to_float(row.weight), cls._to_float(row.length))
+
+    @classmethod
+    def unconvertible_count(cls, row):
+        """重量・長さのうち、値があるのに数値に変換できない（保存するとNoneになる）ものの数"""
+        return sum(1 for value in (row.weight, row.length)
+                   if value is not None and value != '' and cls._to_float(value) is None)
+
+    @classmethod
+    def fingerprint(cls, row):
+        """
+        要素の内容（種別・部材名・断面性能・重量・長さ）を表す64ビットの整数
+
+        版の比較に使う。保存形式による違い（旧形式の文字列の数値など）を除くため
+        保存時と同じ型にそろえ、数値は丸めてから計算する。
+        """
+        row = cls.normalize_row(row)
+        values = (row.type, row.name, row.size,
+                  None if row.weight is None else round(row.weight, 6),
+                  None if row.length is None else round(row.length, 6))
+        digest = hashlib.blake2b(repr(values).encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+
+    @staticmethod
+    def dict_from_row(row):
+        """ElementRowを解析結果と同じ形式の辞書に変換する（値がない項目は未定義）"""
+        return {
+            'type': row.type,
+            'global_id': row.global_id,
+            'name': row.name if row.name is not None else UNDEFINED,
+            'size': row.size if row.size is not None else UNDEFINED,
+            'weight': row.weight if row.weight is not None else UNDEFINED,
+            'length': row.length if row.length is not None else UNDEFINED,
+        }
+
+    def to_dict(self):
+        """解析結果と同じ形式の辞書を返す（値がない項目は未定義）"""
+        return self.dict_from_row(ElementRow(self.ifc_type, self.global_id, self.name,
+                                             self.size, self.weight, self.length))
+
+    def __repr__(self):
+        return f'<Element {self.ifc_type} {self.global_id}>'
+
+class ParseJob(db.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    filepath = db.Column(db.String(1024), nullable=False)
+    file_hash = db.Column(db.String(64), nullable=True)
+    status = db.Column(db.String(16), nullable=False, default=STATUS_QUEUED, index=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    upload_id = db.Column(db.Integer, db.ForeignKey('upload_history.id'), nullable=True)
+    # 解析をプロファイラの下で実行する
+    profile = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    # 解析の進捗（処理中の段階と処理済み数・総数）
+    stage = db.Column(db.String(32), nullable=True)
+    progress_done = db.Column(db.Integer, nullable=True)
+    progress_total = db.Column(db.Integer, nullable=True)
+    # 一括アップロードで登録された場合のバッチ
+    batch_id = db.Column(db.Integer, db.ForeignKey('upload_batch.id'), nullable=True, index=True)
+    # 事前走査の結果（スキーマ・全エンティティ数・抽出対象の要素数）と推定メモリ使用量（バイト）
+    schema = db.Column(db.String(32), nullable=True)
+    entity_count = db.Column(db.Integer, nullable=True)
+    target_count = db.Column(db.Integer, nullable=True)
+    memory_estimate = db.Column(db.BigInteger, nullable=True)
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'error': self.error,
+            'upload_id': self.upload_id,
+            'stage': self.stage,
+            'progress_done': self.progress_done,
+            'progress_total': self.progress_total,
+            'schema': self.schema,
+            'entity_count': self.entity_count,
+            'target_count': self.target_count,
+        }
+
+    def __repr__(self):
+        return f'<ParseJob {self.id} {self.status}>'
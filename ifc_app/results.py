@@ -0,0 +1,523 @@
+import os
+import glob
+import json
+import shutil
+import logging
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app
+from .db import db
+from .models import UploadHistory, Element
+from .utils.extraction_spec import ElementRow
+from .utils.columnar import ColumnarWriter, ColumnarReader
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# 一括挿入1回あたりの行数
+INSERT_BATCH_SIZE = 1000
+
+# 並べ替えに使用できる項目
+SORT_COLUMNS = {
+    'type': Element.ifc_type,
+    'name': Element.name,
+    'size': Element.size,
+    'weight': Element.weight,
+    'length': Element.length,
+}
+
+# 列指向ファイルの列（ElementRowの順序）と型
+COLUMNAR_COLUMNS = {
+    'type': 'string',
+    'global_id': 'string',
+    'name': 'string',
+    'size': 'string',
+    'weight': 'float',
+    'length': 'float',
+}
+
+# 絞り込みの対象の列
+FILTER_COLUMNS = ('type', 'name', 'size')
+
+# 部材種別×断面性能ごとの集計（長さ・重量の合計は値のある要素がなければNone）
+SummaryRow = namedtuple('SummaryRow', ('type', 'size', 'count', 'length', 'weight'))
+
+# 版の間の差分（追加された要素はoldが、削除された要素はnewがNone）
+DIFF_ADDED = 'added'
+DIFF_REMOVED = 'removed'
+DIFF_CHANGED = 'changed'
+DiffRow = namedtuple('DiffRow', ('status', 'global_id', 'old', 'new'))
+
+
+def _result_directory(upload_id):
+    return os.path.join(current_app.config['RESULT_DATA_DIR'], str(upload_id))
+
+
+def _default_storage():
+    storage = current_app.config['RESULT_STORAGE']
+    if storage not in (UploadHistory.STORAGE_SQL, UploadHistory.STORAGE_COLUMNAR):
+        raise ValueError(f"不明な保存先です: {storage}")
+    return storage
+
+
+def store_elements(upload_id, rows, batch_size=INSERT_BATCH_SIZE, commit=False):
+    """
+    解析結果をElementテーブルに一括挿入する
+
+    Args:
+        upload_id (int): 対象のアップロード履歴ID
+        rows (iterable): 解析結果の行（ElementRow）
+        batch_size (int): 1回のINSERTで挿入する行数
+        commit (bool): INSERTごとにコミットする（Falseならコミットは呼び出し側で行う）
+
+    Returns:
+        int: 挿入した行数
+    """
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(Element.insert_values(upload_id, row))
+        if len(batch) >= batch_size:
+            db.session.execute(db.insert(Element).values(batch))
+            if commit:
+                db.session.commit()
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(Element).values(batch))
+        if commit:
+            db.session.commit()
+        count += len(batch)
+    return count
+
+
+def store_columnar(upload_id, rows):
+    """
+    解析結果を列指向ファイルに保存する
+
+    Args:
+        upload_id (int): 対象のアップロード履歴ID
+        rows (iterable): 解析結果の行（ElementRow）
+
+    Returns:
+        int: 保存した行数
+    """
+    with ColumnarWriter(_result_directory(upload_id), COLUMNAR_COLUMNS) as writer:
+        writer.write(Element.normalize_row(row) for row in rows)
+    return writer.count
+
+
+def _store(history, rows, commit=False):
+    if history.storage == UploadHistory.STORAGE_COLUMNAR:
+        return store_columnar(history.id, rows)
+    return store_elements(history.id, rows, commit=commit)
+
+
+def record_upload(filename, user_id, rows, incremental=False, batch_id=None, created=None):
+    """
+    解析結果をアップロード履歴として保存する（最後のコミットは呼び出し側で行う）
+
+    rowsはイテレータでもよく、読み込みながら一括挿入するため全件を保持しない。
+
+    Args:
+        filename (str): 元のファイル名
+        user_id (int): アップロードしたユーザーのID
+        rows (iterable): 解析結果の行（ElementRow）
+        incremental (bool): INSERTごとにコミットする。解析しながら保存する場合に
+            書き込みロックを解析の間ずっと保持しないよう使う。保存中の履歴は
+            complete=Falseとし、失敗した場合は保存済みの要素ごと削除する
+        batch_id (int): 一括アップロードのバッチID
+        created (callable): incremental の場合、保存中の履歴をコミットした直後にそのIDを受け取る関数
+            （解析ジョブに記録し、ワーカーが異常終了した場合に保存途中の履歴を削除するため）
+
+    保存先は設定（RESULT_STORAGE）に従う。同じユーザーが同じファイル名で登録した
+    最新の履歴を前の版として記録する。
+
+    Returns:
+        UploadHistory: 保存した履歴
+    """
+    history = UploadHistory(
+        filename=filename,
+        processed_date=datetime.now(),
+        element_count=0,
+        user_id=user_id,
+        complete=not incremental,
+        storage=_default_storage(),
+        batch_id=batch_id,
+        parent_id=previous_revision_id(filename, user_id)
+    )
+    db.session.add(history)
+    if not incremental:
+        db.session.flush()
+        history.element_count = _store(history, rows)
+        return history
+
+    db.session.commit()
+    history_id = history.id
+    if created is not None:
+        created(history_id)
+    try:
+        count = _store(history, rows, commit=True)
+    except Exception:
+        db.session.rollback()
+        discard_upload(history_id)
+        raise
+    history = db.session.get(UploadHistory, history_id)
+    history.element_count = count
+    history.complete = True
+    return history
+
+
+def previous_revision_id(filename, user_id):
+    """同じユーザーが同じファイル名で最後に登録した完了済みの履歴のID（なければNone）"""
+    return db.session.scalar(
+        db.select(UploadHistory.id)
+        .where(UploadHistory.user_id == user_id, UploadHistory.filename == filename,
+               UploadHistory.complete.is_(True))
+        .order_by(UploadHistory.processed_date.desc(), UploadHistory.id.desc())
+        .limit(1)
+    )
+
+
+def discard_upload(upload_id):
+    """保存途中の履歴と要素を削除する（書き込み途中の列指向ファイルの一時ディレクトリを含む）"""
+    db.session.execute(db.delete(Element).where(Element.upload_id == upload_id))
+    db.session.execute(db.delete(UploadHistory).where(UploadHistory.id == upload_id))
+    db.session.commit()
+    directory = _result_directory(upload_id)
+    shutil.rmtree(directory, ignore_errors=True)
+    for path in glob.glob(f"{glob.escape(directory)}.*.tmp"):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def iter_upload_elements(upload, batch_size=INSERT_BATCH_SIZE):
+    """
+    アップロード履歴の要素をID順に少しずつ読み込み、ElementRowとして返す
+
+    全件をメモリに載せないよう、IDをキーにしたページングで必要な列だけを読み込む。
+    保存先の判定と旧形式のJSONの読み込みは呼び出した時点で行うため、返したイテレータは
+    レスポンスのストリーミング中（履歴がセッションから外れた後）に読み出してもよい。
+    """
+    if upload.processed_data is not None:
+        return (Element.row_from_dict(data) for data in json.loads(upload.processed_data))
+    if upload.storage == UploadHistory.STORAGE_COLUMNAR:
+        reader = ColumnarReader(_result_directory(upload.id))
+        return (ElementRow(*values) for values in reader.iter_rows(ElementRow._fields))
+    return _iter_element_table(upload.id, batch_size)
+
+
+def _iter_element_table(upload_id, batch_size):
+    last_id = 0
+    while True:
+        batch = db.session.execute(
+            db.select(Element.id, Element.ifc_type, Element.global_id, Element.name,
+                      Element.size, Element.weight, Element.length)
+            .where(Element.upload_id == upload_id, Element.id > last_id)
+            .order_by(Element.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        for row in batch:
+            yield ElementRow(*row[1:])
+        last_id = batch[-1].id
+
+
+def migrate_upload(upload):
+    """
+    旧形式のJSONを設定された保存先へ移し、JSON列を空にする
+
+    重量・長さに数値へ変換できない値（"12.5 kg" など）がある履歴は、値を失わないよう
+    移行せずJSONのまま残す（旧形式のまま表示・出力できる）。
+
+    Returns:
+        tuple: (移行した要素数（移行しなかった場合はNone）, 数値に変換できなかった値の数)
+    """
+    rows = [Element.row_from_dict(data) for data in json.loads(upload.processed_data)]
+    invalid = sum(Element.unconvertible_count(row) for row in rows)
+    if invalid:
+        logger.warning(f"履歴 {upload.id} には数値に変換できない重量・長さが {invalid} 件あるため移行しません")
+        return None, invalid
+
+    upload.storage = _default_storage()
+    count = _store(upload, rows)
+    upload.element_count = count
+    upload.processed_data = None
+    return count, 0
+
+
+def query_elements(upload, offset=0, limit=100, sort=None, filter_text=None):
+    """
+    アップロード履歴の要素を絞り込み・並べ替えて1ページ分だけ返す
+
+    Args:
+        upload (UploadHistory): 対象のアップロード履歴
+        offset (int): 先頭から読み飛ばす件数
+        limit (int): 返す最大件数
+        sort (str): 並べ替える項目（先頭に'-'を付けると降順。値のない項目は昇順・降順とも末尾、同値は保存順）
+        filter_text (str): 部材種別・部材名・断面性能に含まれる文字列
+
+    Returns:
+        tuple: (条件に一致した件数, 要素の辞書のリスト)
+    """
+    descending = bool(sort) and sort.startswith('-')
+    sort_key = sort.lstrip('-') if sort else None
+    if sort_key is not None and sort_key not in SORT_COLUMNS:
+        raise ValueError(f"並べ替えできない項目です: {sort_key}")
+
+    if upload.processed_data is not None:
+        return _query_legacy(upload, offset, limit, sort_key, descending, filter_text)
+    if upload.storage == UploadHistory.STORAGE_COLUMNAR:
+        return _query_columnar(upload, offset, limit, sort_key, descending, filter_text)
+
+    query = Element.query.filter_by(upload_id=upload.id)
+    if filter_text:
+        query = query.filter(db.or_(
+            Element.ifc_type.icontains(filter_text, autoescape=True),
+            Element.name.icontains(filter_text, autoescape=True),
+            Element.size.icontains(filter_text, autoescape=True),
+        ))
+    total = query.order_by(None).count()
+
+    if sort_key is not None:
+        column = SORT_COLUMNS[sort_key]
+        query = query.order_by((column.desc() if descending else column.asc()).nulls_last())
+    query = query.order_by(Element.id)
+
+    rows = query.offset(offset).limit(limit).all()
+    return total, [row.to_dict() for row in rows]
+
+
+def _query_legacy(upload, offset, limit, sort_key, descending, filter_text):
+    """
+    移行前のJSON形式の履歴を同じ条件で絞り込む
+
+    値は保存時と同じ型（文字列・数値）にそろえてから比較し、他の保存先と同じ形式の辞書を返す。
+    """
+    rows = [Element.normalize_row(Element.row_from_dict(data)) for data in json.loads(upload.processed_data)]
+    if filter_text:
+        needle = filter_text.lower()
+        rows = [row for row in rows
+                if any(value is not None and needle in value.lower() for value in (row.type, row.name, row.size))]
+    if sort_key is not None:
+        rows = _sort_missing_last(rows, lambda row: getattr(row, sort_key), descending)
+    return len(rows), [Element.dict_from_row(row) for row in rows[offset:offset + limit]]
+
+
+def _sort_missing_last(items, value, descending):
+    """値で並べ替え、値のない項目は昇順・降順とも末尾にまとめる（同値は元の順序）"""
+    present = [item for item in items if value(item) is not None]
+    missing = [item for item in items if value(item) is None]
+    return sorted(present, key=value, reverse=descending) + missing
+
+
+def _query_columnar(upload, offset, limit, sort_key, descending, filter_text):
+    """
+    列指向ファイルの履歴を同じ条件で絞り込む
+
+    条件がなければ該当ページを含む部分だけを読み、絞り込み・並べ替えがあれば
+    対象の列だけを読んで行番号を決めてから、表示する行だけを読み込む。
+    並べ替えはElementテーブルと同じ順序（値のない項目は末尾、同値は保存順）とする。
+    """
+    reader = ColumnarReader(_result_directory(upload.id))
+    if not filter_text and sort_key is None:
+        data = reader.read_columns(ElementRow._fields, offset, offset + limit)
+        rows = [ElementRow(*values) for values in zip(*(data[column] for column in ElementRow._fields))]
+        return reader.count, [Element.dict_from_row(row) for row in rows]
+
+    indices = range(reader.count)
+    if filter_text:
+        needle = filter_text.lower()
+        data = reader.read_columns(FILTER_COLUMNS)
+        columns = [data[column] for column in FILTER_COLUMNS]
+        indices = [i for i in indices
+                   if any(values[i] is not None and needle in values[i].lower() for values in columns)]
+    if sort_key is not None:
+        values = reader.read_columns((sort_key,))[sort_key]
+        indices = _sort_missing_last(indices, values.__getitem__, descending)
+
+    page = list(indices[offset:offset + limit])
+    rows = [ElementRow(*values) for values in reader.take(page, ElementRow._fields)]
+    return len(indices), [Element.dict_from_row(row) for row in rows]
+
+
+def summarize_elements(upload):
+    """
+    部材種別×断面性能ごとに要素数・長さの合計・重量の合計を集計する
+
+    ElementテーブルではGROUP BYで、列指向ファイルでは必要な列だけを読んで
+    NumPyで集計するため、要素の行をPythonに読み込まない。
+
+    Args:
+        upload (UploadHistory): 対象のアップロード履歴
+
+    Returns:
+        list: SummaryRowのリスト（部材種別・断面性能の順、値のない断面性能は先頭）
+    """
+    if upload.processed_data is not None:
+        # 旧形式の値は文字列の数値を含むため、保存時と同じ型にそろえてから合計する
+        rows = _summarize_rows(Element.normalize_row(Element.row_from_dict(data))
+                               for data in json.loads(upload.processed_data))
+    elif upload.storage == UploadHistory.STORAGE_COLUMNAR:
+        rows = _summarize_columnar(upload)
+    else:
+        rows = [
+            SummaryRow(*row) for row in db.session.execute(
+                db.select(Element.ifc_type, Element.size, db.func.count(Element.id),
+                          db.func.sum(Element.length), db.func.sum(Element.weight))
+                .where(Element.upload_id == upload.id)
+                .group_by(Element.ifc_type, Element.size)
+            )
+        ]
+    return _sort_summary(rows)
+
+
+def _sort_summary(rows):
+    """部材種別・断面性能の順に並べる（値のない断面性能は先頭）"""
+    return sorted(rows, key=lambda row: (row.type, row.size is not None, row.size or ''))
+
+
+def merge_summaries(summaries):
+    """
+    複数の履歴の集計を部材種別×断面性能ごとに合算する（一括アップロードの集計）
+
+    Args:
+        summaries (iterable): summarize_elementsの結果のリスト
+
+    Returns:
+        list: SummaryRowのリスト（summarize_elementsと同じ順序）
+    """
+    totals = {}
+    for rows in summaries:
+        for row in rows:
+            total = totals.get((row.type, row.size))
+            if total is None:
+                totals[(row.type, row.size)] = list(row[2:])
+                continue
+            total[0] += row.count
+            for index, value in ((1, row.length), (2, row.weight)):
+                if value is not None:
+                    total[index] = (total[index] or 0) + value
+    return _sort_summary(SummaryRow(ifc_type, size, *total) for (ifc_type, size), total in totals.items())
+
+
+def _summarize_rows(rows):
+    """行を1件ずつ集計する（旧形式の履歴、NumPyがない場合）"""
+    totals = {}
+    for row in rows:
+        total = totals.get((row.type, row.size))
+        if total is None:
+            total = totals[(row.type, row.size)] = [0, None, None]
+        total[0] += 1
+        if row.length is not None:
+            total[1] = (total[1] or 0) + row.length
+        if row.weight is not None:
+            total[2] = (total[2] or 0) + row.weight
+    return [SummaryRow(ifc_type, size, *total) for (ifc_type, size), total in totals.items()]
+
+
+def _summarize_columnar(upload):
+    """列指向ファイルの種別・断面性能・長さ・重量の列だけを読んで集計する"""
+    reader = ColumnarReader(_result_directory(upload.id))
+    if numpy is None:
+        return _summarize_rows(ElementRow(ifc_type, None, None, size, weight, length)
+                               for ifc_type, size, weight, length
+                               in reader.iter_rows(('type', 'size', 'weight', 'length')))
+
+    data = reader.read_columns(('type', 'size', 'weight', 'length'))
+    if not data['type']:
+        return []
+    types, type_codes = numpy.unique(numpy.array(data['type'], dtype=str), return_inverse=True)
+    # 値のない断面性能は空文字列と区別するため、符号の最下位ビットで表す
+    size_values = numpy.array(data['size'], dtype=object)
+    size_missing = numpy.equal(size_values, None)
+    sizes, size_codes = numpy.unique(numpy.where(size_missing, '', size_values).astype(str), return_inverse=True)
+    size_keys = len(sizes) * 2
+    groups, group_codes = numpy.unique(type_codes * size_keys + size_codes * 2 + size_missing,
+                                       return_inverse=True)
+
+    counts = numpy.bincount(group_codes, minlength=len(groups))
+    sums = {}
+    for column in ('length', 'weight'):
+        values = numpy.array(data[column], dtype=float)
+        present = ~numpy.isnan(values)
+        sums[column] = (
+            numpy.bincount(group_codes, weights=numpy.where(present, values, 0.0), minlength=len(groups)),
+            numpy.bincount(group_codes, weights=present, minlength=len(groups)),
+        )
+
+    def total(column, index):
+        values, present = sums[column]
+        return float(values[index]) if present[index] else None
+
+    rows = []
+    for index, group in enumerate(groups):
+        ifc_type, size_key = divmod(int(group), size_keys)
+        size = None if size_key % 2 else str(sizes[size_key // 2])
+        rows.append(SummaryRow(str(types[ifc_type]), size,
+                               int(counts[index]), total('length', index), total('weight', index)))
+    return rows
+
+
+def has_global_ids(upload):
+    """
+    要素にGlobalIdが記録されているか（要素がない場合はTrue）
+
+    旧形式（JSON）の履歴と、そこから移行した履歴にはGlobalIdがないため版の比較に使えない。
+    """
+    if not upload.element_count:
+        return True
+    if upload.processed_data is not None:
+        return any(data.get('global_id') for data in json.loads(upload.processed_data))
+    if upload.storage == UploadHistory.STORAGE_COLUMNAR:
+        values = ColumnarReader(_result_directory(upload.id)).read_columns(('global_id',))['global_id']
+        return any(value is not None for value in values)
+    return db.session.scalar(db.select(
+        db.exists().where(Element.upload_id == upload.id, Element.global_id.is_not(None))
+    ))
+
+
+def iter_diff(base, upload):
+    """
+    2つの履歴の要素をGlobalIdで対応付け、追加・削除・変更された要素を返す
+
+    変更の判定には要素の内容のフィンガープリント（Element.fingerprint）を使う。
+    比較元はGlobalIdとフィンガープリントだけを保持し、要素の行は変更・削除された
+    ものだけを読み直すため、全件の行をメモリに保持しない。GlobalIdのない要素は比較しない
+    （GlobalIdが記録されていない履歴かどうかは呼び出し側で has_global_ids により確認する）。
+
+    Args:
+        base (UploadHistory): 比較元（前の版）
+        upload (UploadHistory): 比較先
+
+    Yields:
+        DiffRow: 追加された要素（比較先の順）、続いて変更・削除された要素（比較元の順）
+    """
+    base_fingerprints = {
+        row.global_id: Element.fingerprint(row)
+        for row in iter_upload_elements(base) if row.global_id is not None
+    }
+
+    changed = {}
+    seen = set()
+    for row in iter_upload_elements(upload):
+        if row.global_id is None:
+            continue
+        seen.add(row.global_id)
+        if row.global_id not in base_fingerprints:
+            yield DiffRow(DIFF_ADDED, row.global_id, None, row)
+        elif base_fingerprints[row.global_id] != Element.fingerprint(row):
+            changed[row.global_id] = row
+    del base_fingerprints
+
+    for row in iter_upload_elements(base):
+        if row.global_id is None:
+            continue
+        if row.global_id in changed:
+            yield DiffRow(DIFF_CHANGED, row.global_id, row, changed.pop(row.global_id))
+        elif row.global_id not in seen:
+            yield DiffRow(DIFF_REMOVED, row.global_id, row, None)
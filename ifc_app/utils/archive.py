@@ -0,0 +1,66 @@
+"""
+ZIPアーカイブからのIFCファイルの取り出し
+
+アーカイブ全体を展開せず、含まれるIFCファイルを1つずつストリームとして返す。
+受信したZIPはWerkzeugが一時ファイルに保存しているため、中央ディレクトリだけを読み込み、
+各ファイルは読み出しながら展開する。
+"""
+import os
+import zipfile
+import logging
+from .upload_stream import UploadRejected
+
+logger = logging.getLogger(__name__)
+
+# ZIPの汎用フラグのうち、ファイル名がUTF-8であることを示すビット
+_UTF8_FLAG = 0x800
+
+
+def is_zip_filename(filename):
+    return filename.lower().endswith('.zip')
+
+
+def _member_name(info):
+    """ファイル名を復元する（UTF-8フラグのないZIPは日本語WindowsのCP932として解釈する）"""
+    name = info.filename
+    if not info.flag_bits & _UTF8_FLAG:
+        try:
+            name = name.encode('cp437').decode('cp932')
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            pass
+    return os.path.basename(name.replace('\\', '/'))
+
+
+def iter_ifc_members(fileobj, max_files):
+    """
+    ZIPアーカイブに含まれるIFCファイルを1つずつ返す
+
+    ディレクトリ、IFC以外のファイル、macOSが付加する __MACOSX 以下のファイルは読み飛ばす。
+
+    Args:
+        fileobj: ZIPアーカイブのファイルオブジェクト（シーク可能であること）
+        max_files (int): 受け付けるIFCファイル数の上限
+
+    Yields:
+        tuple: (ファイル名, 展開しながら読み込むファイルオブジェクト)
+
+    Raises:
+        UploadRejected: ZIPとして読み込めない場合、またはファイル数が上限を超える場合
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise UploadRejected('ZIPファイルを読み込めません')
+
+    with archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and not info.filename.startswith('__MACOSX/')
+            and _member_name(info).lower().endswith('.ifc')
+        ]
+        if len(members) > max_files:
+            raise UploadRejected(f"ZIPに含まれるIFCファイルが多すぎます（上限 {max_files} ファイル）")
+        for info in members:
+            with archive.open(info) as member:
+                yield _member_name(info), member
@@ -0,0 +1,201 @@
+"""
+抽出結果の列指向ファイル形式
+
+1つのアップロードの要素を、一定行数ごとの部分（part）に分けて列ごとに圧縮保存する。
+pyarrowがインストールされていれば部分ごとにParquet（zstd圧縮）で、なければ
+列ごとのgzip圧縮JSON配列で保存する。読み込み時は必要な列・必要な部分だけを読む。
+
+    <directory>/meta.json                 形式・列・部分ごとの行数
+    <directory>/part-00000.parquet        pyarrowがある場合
+    <directory>/part-00000.<列名>.json.gz  pyarrowがない場合
+"""
+import os
+import gzip
+import json
+import uuid
+import shutil
+import logging
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.json'
+
+# 1つの部分にまとめる行数（書き込み時に保持する最大行数）
+PART_ROWS = 50000
+
+FORMAT_PARQUET = 'parquet'
+FORMAT_JSON = 'json'
+
+
+def available_format():
+    """この環境で書き込みに使う形式"""
+    return FORMAT_PARQUET if pyarrow is not None else FORMAT_JSON
+
+
+class ColumnarWriter:
+    """
+    行を受け取り、部分ごとに列指向ファイルへ書き出す
+
+    一時ディレクトリに書き込み、close()で保存先へ置き換える。
+    withブロックが例外で終わった場合は書き込んだファイルを削除する。
+
+    Args:
+        directory (str): 保存先のディレクトリ（既に存在する場合は置き換える）
+        columns (dict): 列名 -> 'string' または 'float'（行の値の順序）
+        part_rows (int): 1つの部分にまとめる行数
+    """
+
+    def __init__(self, directory, columns, part_rows=PART_ROWS):
+        self.directory = directory
+        self.columns = dict(columns)
+        self.part_rows = part_rows
+        self.format = available_format()
+        self.tmp_directory = f"{directory}.{uuid.uuid4().hex}.tmp"
+        self._buffers = [[] for _ in self.columns]
+        self._parts = []
+        self.count = 0
+        os.makedirs(self.tmp_directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+            return False
+        self.close()
+        return False
+
+    def write(self, rows):
+        """行（列の順序の値のタプル）を追加する"""
+        for row in rows:
+            for buffer, value in zip(self._buffers, row):
+                buffer.append(value)
+            if len(self._buffers[0]) >= self.part_rows:
+                self._flush_part()
+
+    def _flush_part(self):
+        rows = len(self._buffers[0])
+        if rows == 0:
+            return
+        name = f"part-{len(self._parts):05d}"
+        if self.format == FORMAT_PARQUET:
+            arrays = [
+                pyarrow.array(values, type=pyarrow.float64() if kind == 'float' else pyarrow.string())
+                for kind, values in zip(self.columns.values(), self._buffers)
+            ]
+            table = pyarrow.Table.from_arrays(arrays, names=list(self.columns))
+            pq.write_table(table, os.path.join(self.tmp_directory, f"{name}.parquet"), compression='zstd')
+        else:
+            for column, values in zip(self.columns, self._buffers):
+                path = os.path.join(self.tmp_directory, f"{name}.{column}.json.gz")
+                with gzip.open(path, 'wt', encoding='utf-8') as f:
+                    json.dump(values, f, ensure_ascii=False)
+        self._parts.append({'name': name, 'rows': rows})
+        self.count += rows
+        self._buffers = [[] for _ in self.columns]
+
+    def close(self):
+        """残りの行を書き出して保存先へ置き換え、行数を返す"""
+        self._flush_part()
+        meta = {'format': self.format, 'columns': self.columns, 'parts': self._parts, 'rows': self.count}
+        with open(os.path.join(self.tmp_directory, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+        os.replace(self.tmp_directory, self.directory)
+        return self.count
+
+    def abort(self):
+        shutil.rmtree(self.tmp_directory, ignore_errors=True)
+
+
+class ColumnarReader:
+    """列指向ファイルから必要な列・範囲だけを読み込む"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.format = meta['format']
+        self.columns = meta['columns']
+        self.parts = meta['parts']
+        self.count = meta['rows']
+        if self.format == FORMAT_PARQUET and pyarrow is None:
+            raise RuntimeError("Parquet形式の結果を読み込むにはpyarrowが必要です")
+
+    def _read_part(self, part, columns):
+        """1つの部分の指定した列を 列名 -> 値のリスト で返す"""
+        if self.format == FORMAT_PARQUET:
+            table = pq.read_table(os.path.join(self.directory, f"{part['name']}.parquet"), columns=list(columns))
+            return {column: table.column(column).to_pylist() for column in columns}
+        data = {}
+        for column in columns:
+            path = os.path.join(self.directory, f"{part['name']}.{column}.json.gz")
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                data[column] = json.load(f)
+        return data
+
+    def _parts_in_range(self, start, stop):
+        """範囲 [start, stop) に重なる部分を (部分, 部分の先頭行) で返す"""
+        first = 0
+        for part in self.parts:
+            last = first + part['rows']
+            if last > start and first < stop:
+                yield part, first
+            if last >= stop:
+                break
+            first = last
+
+    def read_columns(self, columns, start=0, stop=None):
+        """
+        指定した列の範囲 [start, stop) の値を読み込む
+
+        Returns:
+            dict: 列名 -> 値のリスト
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+        result = {column: [] for column in columns}
+        if start >= stop:
+            return result
+        for part, first in self._parts_in_range(start, stop):
+            data = self._read_part(part, columns)
+            lo = max(start - first, 0)
+            hi = min(stop - first, part['rows'])
+            for column in columns:
+                result[column].extend(data[column][lo:hi])
+        return result
+
+    def take(self, indices, columns):
+        """指定した行番号の行を、指定した順序で列の値のタプルとして返す"""
+        wanted = sorted(set(indices))
+        rows = {}
+        first = 0
+        position = 0
+        for part in self.parts:
+            last = first + part['rows']
+            in_part = []
+            while position < len(wanted) and wanted[position] < last:
+                in_part.append(wanted[position])
+                position += 1
+            if in_part:
+                data = self._read_part(part, columns)
+                for index in in_part:
+                    rows[index] = tuple(data[column][index - first] for column in columns)
+            if position >= len(wanted):
+                break
+            first = last
+        return [rows[index] for index in indices]
+
+    def iter_rows(self, columns):
+        """全行を部分ごとに読み込み、列の値のタプルとして返す"""
+        for part in self.parts:
+            data = self._read_part(part, columns)
+            yield from zip(*(data[column] for column in columns))
@@ -1,26 +1,45 @@
-import csv
-from datetime import datetime
+import zlib
+from .exporters import ELEMENT_COLUMNS, CHUNK_ROWS, element_records, iter_csv_records, generate_export_filename
 
-def generate_csv(elements, filepath):
+CSV_HEADER = [column.label for column in ELEMENT_COLUMNS]
+
+
+def iter_csv(rows, chunk_rows=CHUNK_ROWS):
+    """
+    要素情報をCSV（UTF-8 BOM付き）のバイト列として少しずつ生成する
+
+    Args:
+        rows (iterable): 部材情報の行（ElementRow）
+        chunk_rows (int): 1チャンクにまとめる行数
+
+    Yields:
+        bytes: CSVのチャンク（最初のチャンクのみBOMを含む）
+    """
+    return iter_csv_records(ELEMENT_COLUMNS, element_records(rows), chunk_rows)
+
+
+def gzip_chunks(chunks, level=6):
+    """バイト列のチャンクをgzip形式で圧縮しながら返す"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def generate_csv(rows, filepath):
     """
     要素情報をCSVファイルに出力する
-    
+
     Args:
-        elements (list): 部材情報のリスト
+        rows (iterable): 部材情報の行（ElementRow）
         filepath (str): 出力先のファイルパス
     """
-    with open(filepath, 'w', newline='', encoding='utf-8-sig') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["部材種別", "部材名", "断面性能", "重量", "長さ"])
-        for element in elements:
-            writer.writerow([
-                element["type"],
-                element["name"],
-                element["size"],
-                element["weight"],
-                element["length"]
-            ])
-
-def generate_csv_filename():
+    with open(filepath, 'wb') as csvfile:
+        for chunk in iter_csv(rows):
+            csvfile.write(chunk)
+
+def generate_csv_filename(prefix="部材リスト"):
     """CSVファイルの名前を生成する"""
-    return f"部材リスト_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return generate_export_filename(prefix, 'csv')
@@ -0,0 +1,272 @@
+"""
+解析結果の出力形式
+
+出力する表は列の定義（Column）と、各行の値のリストを返すイテラブルで表す。
+どの形式も同じ行のイテラブルを1回だけ読み、値を少しずつ書き出すため、
+行数に関わらずメモリ使用量は一定に保たれる。
+
+    csv      UTF-8 BOM付きCSV（値のない項目は「未定義」）。行を読みながら送信する
+    ndjson   1行1つのJSON（値のない項目はnull）。行を読みながら送信する
+    xlsx     Excel（openpyxlの書き込み専用モード、値のない項目は空欄）
+    parquet  Parquet（pyarrow、値のない項目はnull）
+
+xlsxとparquetはファイルの末尾に索引を持つ形式のため、一時ファイルへ書き出してから送信する。
+openpyxl・pyarrowがインストールされていない環境では、その形式は選択できない。
+"""
+import io
+import csv
+import json
+import tempfile
+from collections import namedtuple
+from datetime import datetime
+from .extraction_spec import UNDEFINED
+
+try:
+    import openpyxl
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+except ImportError:
+    openpyxl = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+    pq = None
+
+# 列の定義（key: ndjson・parquetの名前、label: csv・xlsxの見出し、
+# kind: 'string'・'float'・'int'、missing: csvで値のない項目に出力する文字列）
+Column = namedtuple('Column', ('key', 'label', 'kind', 'missing'), defaults=(UNDEFINED,))
+
+ELEMENT_COLUMNS = (
+    Column('type', "部材種別", 'string'),
+    Column('name', "部材名", 'string'),
+    Column('size', "断面性能", 'string'),
+    Column('weight', "重量", 'float'),
+    Column('length', "長さ", 'float'),
+)
+BATCH_COLUMNS = (Column('source_file', "元ファイル", 'string'),) + ELEMENT_COLUMNS
+SUMMARY_COLUMNS = (
+    Column('type', "部材種別", 'string'),
+    Column('size', "断面性能", 'string'),
+    Column('count', "本数", 'int'),
+    Column('length', "長さ合計", 'float'),
+    Column('weight', "重量合計", 'float'),
+)
+DIFF_COLUMNS = (
+    Column('status', "差分", 'string'),
+    Column('global_id', "GlobalId", 'string'),
+) + ELEMENT_COLUMNS + (
+    Column('old_name', "変更前の部材名", 'string', ''),
+    Column('old_size', "変更前の断面性能", 'string', ''),
+    Column('old_weight', "変更前の重量", 'float', ''),
+    Column('old_length', "変更前の長さ", 'float', ''),
+)
+DIFF_LABELS = {'added': "追加", 'removed': "削除", 'changed': "変更"}
+
+# 1チャンクにまとめる行数（csv・ndjson）
+CHUNK_ROWS = 500
+# 一時ファイルから送信するときの1回の読み込みサイズ（xlsx・parquet）
+FILE_CHUNK_SIZE = 256 * 1024
+# Excelの1シートの最大行数（超える場合は次のシートに続ける）
+XLSX_MAX_ROWS = 1048576
+# Parquetの1つの行グループにまとめる行数
+PARQUET_ROW_GROUP_ROWS = 50000
+
+
+def element_records(rows):
+    """部材情報の行（ElementRow）をELEMENT_COLUMNSの値のリストに変換する"""
+    for row in rows:
+        yield [row.type, row.name, row.size, row.weight, row.length]
+
+
+def batch_records(sources):
+    """(元ファイル名, 部材情報の行) の組をBATCH_COLUMNSの値のリストに変換する"""
+    for filename, rows in sources:
+        for row in rows:
+            yield [filename, row.type, row.name, row.size, row.weight, row.length]
+
+
+def summary_records(rows):
+    """集計行（results.SummaryRow）をSUMMARY_COLUMNSの値のリストに変換する"""
+    for row in rows:
+        yield [row.type, row.size, row.count, row.length, row.weight]
+
+
+def diff_records(diff_rows):
+    """
+    差分の行（results.DiffRow）をDIFF_COLUMNSの値のリストに変換する
+
+    削除された要素は変更前の値を部材情報の列に、変更された要素は変更前の値を末尾の列に出力する。
+    """
+    for diff in diff_rows:
+        current = diff.new if diff.new is not None else diff.old
+        if diff.status == 'changed':
+            previous = [diff.old.name, diff.old.size, diff.old.weight, diff.old.length]
+        else:
+            previous = [None] * 4
+        yield [DIFF_LABELS[diff.status], diff.global_id,
+               current.type, current.name, current.size, current.weight, current.length] + previous
+
+
+def iter_csv_records(columns, records, chunk_rows=CHUNK_ROWS):
+    """
+    行をCSV（UTF-8 BOM付き）のバイト列として少しずつ生成する
+
+    Yields:
+        bytes: CSVのチャンク（最初のチャンクのみBOMを含む）
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.label for column in columns])
+    missing = [column.missing for column in columns]
+    pending = 0
+    first = True
+
+    def take():
+        data = buffer.getvalue().encode('utf-8-sig' if first else 'utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    for record in records:
+        writer.writerow([blank if value is None else value for value, blank in zip(record, missing)])
+        pending += 1
+        if pending >= chunk_rows:
+            yield take()
+            first = False
+            pending = 0
+
+    data = take()
+    if data:
+        yield data
+
+
+def iter_ndjson_records(columns, records, chunk_rows=CHUNK_ROWS):
+    """行を1行1つのJSONオブジェクトとして少しずつ生成する"""
+    keys = [column.key for column in columns]
+    lines = []
+    for record in records:
+        lines.append(json.dumps(dict(zip(keys, record)), ensure_ascii=False))
+        if len(lines) >= chunk_rows:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _iter_file(f):
+    f.seek(0)
+    while True:
+        chunk = f.read(FILE_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _xlsx_value(value):
+    # 制御文字を含む文字列はExcelのファイルに書き込めないため取り除く
+    if isinstance(value, str):
+        return ILLEGAL_CHARACTERS_RE.sub('', value)
+    return value
+
+
+def iter_xlsx_records(columns, records, sheet_title="一覧"):
+    """
+    行をExcelファイルとして書き出し、そのバイト列を返す
+
+    openpyxlの書き込み専用モードは行をシートごとの一時ファイルへ書き出すため、
+    行数に関わらずメモリ使用量は一定になる。1シートの最大行数を超える場合は次のシートに続ける。
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    header = [column.label for column in columns]
+    sheet = None
+    sheet_rows = XLSX_MAX_ROWS
+    for record in records:
+        if sheet_rows >= XLSX_MAX_ROWS:
+            title = sheet_title if sheet is None else f"{sheet_title} ({len(workbook.worksheets) + 1})"
+            sheet = workbook.create_sheet(title)
+            sheet.append(header)
+            sheet_rows = 1
+        sheet.append([_xlsx_value(value) for value in record])
+        sheet_rows += 1
+    if sheet is None:
+        workbook.create_sheet(sheet_title).append(header)
+
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        yield from _iter_file(f)
+
+
+_PARQUET_TYPES = {'string': 'string', 'float': 'float64', 'int': 'int64'}
+
+
+def iter_parquet_records(columns, records, row_group_rows=PARQUET_ROW_GROUP_ROWS):
+    """行を一定行数ごとの行グループとしてParquetファイルに書き出し、そのバイト列を返す"""
+    schema = pyarrow.schema([(column.key, getattr(pyarrow, _PARQUET_TYPES[column.kind])())
+                             for column in columns])
+
+    def write_group(writer, buffers):
+        arrays = [pyarrow.array(values, type=field.type) for values, field in zip(buffers, schema)]
+        writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+
+    with tempfile.TemporaryFile() as f:
+        with pq.ParquetWriter(f, schema, compression='zstd') as writer:
+            buffers = [[] for _ in columns]
+            for record in records:
+                for buffer, value in zip(buffers, record):
+                    buffer.append(value)
+                if len(buffers[0]) >= row_group_rows:
+                    write_group(writer, buffers)
+                    buffers = [[] for _ in columns]
+            if buffers[0]:
+                write_group(writer, buffers)
+        yield from _iter_file(f)
+
+
+class ExportFormat(namedtuple('ExportFormat', ('name', 'label', 'extension', 'mimetype', 'compressible', 'writer'))):
+    """出力形式（compressible: 送信時にgzip圧縮できるテキスト形式）"""
+
+    @property
+    def available(self):
+        if self.name == 'xlsx':
+            return openpyxl is not None
+        if self.name == 'parquet':
+            return pyarrow is not None
+        return True
+
+
+EXPORT_FORMATS = {
+    export_format.name: export_format for export_format in (
+        ExportFormat('csv', "CSV", 'csv', 'text/csv', True, iter_csv_records),
+        ExportFormat('xlsx', "Excel (xlsx)", 'xlsx',
+                     'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', False, iter_xlsx_records),
+        ExportFormat('parquet', "Parquet", 'parquet', 'application/vnd.apache.parquet', False, iter_parquet_records),
+        ExportFormat('ndjson', "JSON Lines", 'ndjson', 'application/x-ndjson', True, iter_ndjson_records),
+    )
+}
+
+
+def available_formats():
+    """この環境で選択できる出力形式"""
+    return [export_format for export_format in EXPORT_FORMATS.values() if export_format.available]
+
+
+def get_export_format(name):
+    """
+    名前から出力形式を返す
+
+    Raises:
+        ValueError: 不明な形式、またはこの環境で出力できない形式の場合
+    """
+    export_format = EXPORT_FORMATS.get(name)
+    if export_format is None:
+        raise ValueError(f"不明な形式です: {name}")
+    if not export_format.available:
+        raise ValueError(f"この環境では出力できない形式です: {name}")
+    return export_format
+
+
+def generate_export_filename(prefix, extension):
+    """出力ファイルの名前を生成する"""
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
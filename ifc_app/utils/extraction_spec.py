@@ -0,0 +1,174 @@
+"""
+部材情報の抽出仕様
+
+抽出仕様は「要素種別 -> 列 -> 参照ルールのリスト」の辞書で表す。
+ルールは先頭から順に評価し、最初に値が得られたものを採用する。
+
+ルールの形式:
+    ('attribute', 属性名)                   要素自体の属性
+    ('property', 'equals', [名前, ...])     プロパティ名（小文字）が一致
+    ('property', 'contains', [語, ...])     プロパティ名（小文字）に語を含む
+    ('quantity', 数量の種別[, [名前, ...]])  数量セットの値（名前は任意）
+    ('material_profile',)                   材料プロファイルのプロファイル名
+"""
+import json
+import hashlib
+from collections import namedtuple
+
+# 全ての種別で出力する列（CSV・Elementテーブルの列に対応）
+COLUMNS = ('name', 'size', 'weight', 'length')
+
+# 部材情報の1行（値が取得できなかった項目はNone）
+ElementRow = namedtuple('ElementRow', ('type', 'global_id') + COLUMNS)
+
+# 値が取得できなかった項目の表示
+UNDEFINED = "未定義"
+
+_NAME = [('attribute', 'Name')]
+_SIZE = [
+    ('attribute', 'Description'),
+    ('property', 'contains', ['section', 'profile', 'size']),
+    ('material_profile',),
+]
+_WEIGHT = [
+    ('property', 'equals', ['weight', 'mass']),
+    ('quantity', 'IfcQuantityWeight'),
+]
+_LENGTH = [('quantity', 'IfcQuantityLength')]
+
+_LINEAR = {'name': _NAME, 'size': _SIZE, 'weight': _WEIGHT, 'length': _LENGTH}
+
+DEFAULT_SPEC = {
+    'IfcBeam': _LINEAR,
+    'IfcColumn': _LINEAR,
+    'IfcMember': _LINEAR,
+    'IfcPlate': {
+        'name': _NAME,
+        'size': _SIZE,
+        'weight': _WEIGHT,
+        'length': [
+            ('quantity', 'IfcQuantityLength', ['length']),
+            ('quantity', 'IfcQuantityLength', ['width']),
+        ] + _LENGTH,
+    },
+    'IfcSlab': {
+        'name': _NAME,
+        'size': _SIZE,
+        'weight': _WEIGHT,
+        'length': [('quantity', 'IfcQuantityLength', ['length', 'perimeter'])] + _LENGTH,
+    },
+    'IfcWall': {
+        'name': _NAME,
+        'size': _SIZE,
+        'weight': _WEIGHT,
+        'length': [('quantity', 'IfcQuantityLength', ['length'])] + _LENGTH,
+    },
+    'IfcFastener': _LINEAR,
+    # ボルト等はIfcFastenerではなくIfcMechanicalFastenerとして出力されることが多い
+    'IfcMechanicalFastener': _LINEAR,
+}
+
+
+def select_types(types=None, spec=None):
+    """
+    抽出仕様から指定した種別だけを取り出す
+
+    Args:
+        types (list): 抽出する種別（Noneなら全て）
+        spec (dict): 元にする抽出仕様（Noneなら既定の仕様）
+    """
+    spec = DEFAULT_SPEC if spec is None else spec
+    if not types:
+        return dict(spec)
+    unknown = [t for t in types if t not in spec]
+    if unknown:
+        raise ValueError(f"抽出仕様にない要素種別です: {', '.join(unknown)}")
+    return {t: spec[t] for t in types}
+
+
+def spec_fingerprint(spec):
+    """抽出仕様の内容を表す短いハッシュ（解析結果キャッシュのキーに使う）"""
+    data = json.dumps(spec, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:8]
+
+
+def _compile_rule(rule):
+    """ルールを (element, relations) -> 値 の関数に変換する（値がなければNone）"""
+    kind = rule[0]
+
+    if kind == 'attribute':
+        attribute = rule[1]
+
+        def accessor(element, relations):
+            value = getattr(element, attribute, None)
+            return value if value not in (None, '') else None
+        return accessor
+
+    if kind == 'property':
+        mode, names = rule[1], tuple(name.lower() for name in rule[2])
+        if mode == 'equals':
+            names = frozenset(names)
+
+            def accessor(element, relations):
+                for name, value in relations.properties:
+                    if name in names:
+                        return value
+                return None
+        elif mode == 'contains':
+            def accessor(element, relations):
+                for name, value in relations.properties:
+                    for keyword in names:
+                        if keyword in name:
+                            return value
+                return None
+        else:
+            raise ValueError(f"不明なプロパティの照合方法です: {mode}")
+        return accessor
+
+    if kind == 'quantity':
+        quantity_type = rule[1]
+        names = frozenset(name.lower() for name in rule[2]) if len(rule) > 2 else None
+
+        def accessor(element, relations):
+            for q_type, name, value in relations.quantities:
+                if q_type == quantity_type and (names is None or name in names):
+                    return value
+            return None
+        return accessor
+
+    if kind == 'material_profile':
+        def accessor(element, relations):
+            return relations.profile_names[0] if relations.profile_names else None
+        return accessor
+
+    raise ValueError(f"不明な抽出ルールです: {kind}")
+
+
+def _compile_column(rules):
+    accessors = tuple(_compile_rule(rule) for rule in rules)
+    if len(accessors) == 1:
+        return accessors[0]
+
+    def accessor(element, relations):
+        for rule_accessor in accessors:
+            value = rule_accessor(element, relations)
+            if value is not None:
+                return value
+        return None
+    return accessor
+
+
+def compile_spec(spec):
+    """
+    抽出仕様を要素種別ごとの列アクセサに変換する
+
+    Returns:
+        dict: 要素種別 -> (列ごとのアクセサ関数のタプル)（列の順序はCOLUMNS）
+    """
+    compiled = {}
+    for ifc_type, columns in spec.items():
+        missing = [column for column in COLUMNS if column not in columns]
+        if missing:
+            raise ValueError(f"{ifc_type} の抽出仕様に列がありません: {', '.join(missing)}")
+        compiled[ifc_type] = tuple(_compile_column(columns[column]) for column in COLUMNS)
+    return compiled
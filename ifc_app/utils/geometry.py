@@ -0,0 +1,151 @@
+"""
+形状から求める部材の長さと重量
+
+数量セットや重量のプロパティがないモデル向けに、ifcopenshellの形状イテレータ
+（マルチスレッド）で対象の要素の形状をまとめて三角形分割し、
+    長さ: 要素の座標系での外形寸法のうち最も長い辺（材軸方向の長さ）
+    重量: 体積 × 材料名から求めた密度
+をNumPyでまとめて計算する。長さはモデルの長さ単位、重量はkgで返す。
+"""
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# 材料名（小文字）に含まれる語と密度（kg/m3）。先に一致したものを採用する
+MATERIAL_DENSITIES = (
+    (('stainless', 'sus'), 7930),
+    (('steel', 'ss400', 'sn400', 'sn490', 'sm400', 'sm490', 'stk', 'bcr', 'bcp', 's235', 's275', 's355', '鋼'), 7850),
+    (('concrete', 'コンクリート', 'fc'), 2400),
+    (('aluminium', 'aluminum', 'アルミ'), 2700),
+    (('timber', 'wood', 'glulam', '木'), 500),
+    (('glass', 'ガラス'), 2500),
+)
+
+# 形状から数量を求める既定の要素種別
+DEFAULT_TYPES = ('IfcBeam', 'IfcColumn', 'IfcMember')
+
+# 形状から数量を求める設定（プロセスプールへ渡せるようタプルにする）
+#   types: 対象の要素種別、threads: 三角形分割のスレッド数、
+#   default_density: 材料から密度が分からない場合の密度（Noneなら重量を求めない）
+GeometryOptions = namedtuple('GeometryOptions', ('types', 'threads', 'default_density'))
+
+
+def options_fingerprint(options):
+    """解析結果キャッシュのキーに含める、結果に影響する設定"""
+    if options is None:
+        return ''
+    return f"geom-{'-'.join(sorted(options.types))}-{options.default_density}"
+
+
+def density_for(material_name, default=None):
+    """材料名から密度（kg/m3）を求める（該当しなければdefault）"""
+    if material_name:
+        name = material_name.lower()
+        for keywords, density in MATERIAL_DENSITIES:
+            if any(keyword in name for keyword in keywords):
+                return density
+    return default
+
+
+def _material_names(ifc_file):
+    """要素ID -> 最初に関連付けられた材料名"""
+    names = {}
+    for rel in ifc_file.by_type('IfcRelAssociatesMaterial'):
+        name = _material_name(rel.RelatingMaterial)
+        if name is None:
+            continue
+        for obj in rel.RelatedObjects:
+            names.setdefault(obj.id(), name)
+    return names
+
+
+def _material_name(material):
+    if material is None:
+        return None
+    if material.is_a('IfcMaterial'):
+        return material.Name
+    if material.is_a('IfcMaterialProfileSetUsage'):
+        return _material_name(material.ForProfileSet)
+    if material.is_a('IfcMaterialProfileSet'):
+        profiles = [profile for profile in material.MaterialProfiles if profile.Material]
+        return profiles[0].Material.Name if profiles else None
+    if material.is_a('IfcMaterialLayerSetUsage'):
+        return _material_name(material.ForLayerSet)
+    if material.is_a('IfcMaterialLayerSet'):
+        layers = [layer for layer in material.MaterialLayers if layer.Material]
+        return layers[0].Material.Name if layers else None
+    if material.is_a('IfcMaterialList'):
+        return material.Materials[0].Name if material.Materials else None
+    return None
+
+
+def compute_quantities(ifc_file, elements, threads=1, default_density=None):
+    """
+    要素の形状から長さと重量をまとめて求める
+
+    形状イテレータが返した頂点・三角形を全要素分連結し、体積（符号付き四面体体積の和）と
+    外形寸法を要素ごとに集計する。形状のない要素は結果に含まれない。
+
+    Args:
+        ifc_file: ifcopenshellで開いたIFCファイル
+        elements (list): 対象の要素
+        threads (int): 形状の三角形分割に使うスレッド数
+        default_density (float): 材料から密度が分からない場合の密度（Noneなら重量を求めない）
+
+    Returns:
+        dict: 要素ID -> (長さ, 重量)（重量が求められない場合はNone）
+    """
+    import numpy
+    import ifcopenshell.geom
+    import ifcopenshell.util.unit
+
+    if not elements:
+        return {}
+
+    settings = ifcopenshell.geom.settings()
+    iterator = ifcopenshell.geom.iterator(settings, ifc_file, max(threads, 1), include=elements)
+    ids = []
+    vertex_arrays = []
+    triangle_arrays = []
+    if iterator.initialize():
+        while True:
+            shape = iterator.get()
+            geometry = shape.geometry
+            vertices = numpy.asarray(geometry.verts, dtype=float).reshape(-1, 3)
+            if len(vertices):
+                ids.append(shape.id)
+                vertex_arrays.append(vertices)
+                triangle_arrays.append(numpy.asarray(geometry.faces, dtype=numpy.int64).reshape(-1, 3))
+            if not iterator.next():
+                break
+    if not ids:
+        return {}
+
+    # 要素ごとの頂点・三角形を連結し、三角形の頂点番号を連結後の番号にずらす
+    vertex_counts = numpy.array([len(vertices) for vertices in vertex_arrays])
+    vertex_offsets = numpy.concatenate(([0], numpy.cumsum(vertex_counts)[:-1]))
+    triangle_counts = numpy.array([len(triangles) for triangles in triangle_arrays])
+    vertices = numpy.concatenate(vertex_arrays)
+    triangles = numpy.concatenate(triangle_arrays) + numpy.repeat(vertex_offsets, triangle_counts)[:, None]
+    triangle_owner = numpy.repeat(numpy.arange(len(ids)), triangle_counts)
+
+    a, b, c = vertices[triangles[:, 0]], vertices[triangles[:, 1]], vertices[triangles[:, 2]]
+    signed = numpy.einsum('ij,ij->i', a, numpy.cross(b, c)) / 6.0
+    volumes = numpy.abs(numpy.bincount(triangle_owner, weights=signed, minlength=len(ids)))
+
+    extents = numpy.maximum.reduceat(vertices, vertex_offsets) - numpy.minimum.reduceat(vertices, vertex_offsets)
+    # 形状はメートル単位で返るため、数量セットの値と同じモデルの長さ単位に戻す
+    lengths = extents.max(axis=1) / ifcopenshell.util.unit.calculate_unit_scale(ifc_file)
+
+    materials = _material_names(ifc_file)
+    densities = numpy.array([
+        density_for(materials.get(element_id), default_density) or numpy.nan for element_id in ids
+    ], dtype=float)
+    weights = volumes * densities
+
+    logger.debug(f"{len(ids)} 要素の形状から数量を求めました")
+    return {
+        element_id: (float(length), None if numpy.isnan(weight) else float(weight))
+        for element_id, length, weight in zip(ids, lengths, weights)
+    }
@@ -1,114 +1,334 @@
-import ifcopenshell
 import logging
+from contextlib import nullcontext
+from .extraction_spec import DEFAULT_SPEC, ElementRow, compile_spec, spec_fingerprint
 
 logger = logging.getLogger(__name__)
 
-def process_ifc_file(filepath):
+# ifcopenshellは読み込みに時間がかかるため、解析を実行する関数の中でだけimportする
+# （Webワーカーの起動時やキャッシュキーの計算では読み込まない）
+
+# 抽出結果の形式や内容が変わるときに更新する（解析結果キャッシュのキーに含まれる）
+PARSER_VERSION = "6"
+
+# 抽出の進捗を通知する間隔（要素数）
+PROGRESS_EVERY = 500
+
+
+class ElementRelations:
+    """要素に関連付けられたプロパティ・数量・材料プロファイルの索引"""
+    __slots__ = ('properties', 'quantities', 'profile_names')
+
+    def __init__(self):
+        # (小文字のプロパティ名, 値) のリスト
+        self.properties = []
+        # (数量の種別, 小文字の数量名, 値) のリスト
+        self.quantities = []
+        self.profile_names = []
+
+
+_EMPTY_RELATIONS = ElementRelations()
+
+
+def _no_stage(name):
+    return nullcontext()
+
+
+def _no_progress(stage, done, total):
+    pass
+
+
+def build_relation_index(ifc_file, elements=None):
     """
-    IFCファイルを処理して部材情報を抽出する
+    ファイル全体の関連付けを一度だけ走査し、要素IDごとの索引を作成する
+
+    Args:
+        ifc_file: ifcopenshellで開いたIFCファイル
+        elements (list): 指定した場合、これらの要素の関連付けだけを逆参照で集めて索引にする
+            （並列抽出の各プロセスが担当範囲外の関連付けを読まないため）。
+            関連付けはファイル全体を走査する場合と同じID順に処理する
+
+    Returns:
+        dict: 要素ID -> ElementRelations
+    """
+    index = {}
+
+    if elements is None:
+        property_rels = ifc_file.by_type('IfcRelDefinesByProperties')
+        material_rels = ifc_file.by_type('IfcRelAssociatesMaterial')
+
+        def related(rel):
+            return rel.RelatedObjects
+    else:
+        element_ids = {element.id() for element in elements}
+        property_rels = _inverse_relations(elements, 'IsDefinedBy', 'IfcRelDefinesByProperties')
+        material_rels = _inverse_relations(elements, 'HasAssociations', 'IfcRelAssociatesMaterial')
+
+        def related(rel):
+            return [obj for obj in rel.RelatedObjects if obj.id() in element_ids]
+
+    def relations_for(obj):
+        relations = index.get(obj.id())
+        if relations is None:
+            relations = index[obj.id()] = ElementRelations()
+        return relations
+
+    # プロパティセット・数量セット（複数要素で共有されるため値は一度だけ読む）
+    for rel in property_rels:
+        definition = rel.RelatingPropertyDefinition
+        if definition is None:
+            continue
+        if definition.is_a('IfcPropertySet'):
+            values = _property_values(definition)
+            for obj in related(rel):
+                relations_for(obj).properties.extend(values)
+        elif definition.is_a('IfcElementQuantity'):
+            quantities = _quantity_values(definition)
+            if quantities:
+                for obj in related(rel):
+                    relations_for(obj).quantities.extend(quantities)
+
+    # 材料プロファイル
+    for rel in material_rels:
+        material = rel.RelatingMaterial
+        if material is None or not material.is_a('IfcMaterialProfileSet'):
+            continue
+        names = [profile.Profile.ProfileName for profile in material.MaterialProfiles if profile.Profile]
+        if names:
+            for obj in related(rel):
+                relations_for(obj).profile_names.extend(names)
+
+    return index
+
+
+def _inverse_relations(elements, attribute, rel_type):
+    """要素の逆参照（IsDefinedByなど）から指定した種別の関連付けを重複なくID順に集める"""
+    rels = {}
+    for element in elements:
+        for rel in getattr(element, attribute, None) or ():
+            if rel.is_a(rel_type):
+                rels[rel.id()] = rel
+    return [rels[rel_id] for rel_id in sorted(rels)]
+
+
+def _property_values(property_set):
+    """プロパティセットから (小文字の名前, 値) の組を取り出す"""
+    values = []
+    for prop in property_set.HasProperties:
+        if not prop.Name or not hasattr(prop, 'NominalValue') or prop.NominalValue is None:
+            continue
+        values.append((prop.Name.lower(), prop.NominalValue.wrappedValue))
+    return values
+
+
+def _quantity_values(element_quantity):
+    """数量セットから (種別, 小文字の名前, 値) の組を取り出す"""
+    values = []
+    for quantity in element_quantity.Quantities:
+        # IfcPhysicalSimpleQuantityの値は4番目の属性（LengthValue, WeightValueなど）
+        if not quantity.is_a('IfcPhysicalSimpleQuantity') or quantity[3] is None:
+            continue
+        values.append((quantity.is_a(), (quantity.Name or '').lower(), quantity[3]))
+    return values
+
+
+class _TypeResolver:
+    """要素のクラスを抽出仕様の種別に対応付ける（サブタイプも含め、クラスごとに一度だけ判定）"""
+
+    def __init__(self, types):
+        self.types = types
+        self._cache = {}
+
+    def __call__(self, element):
+        cls = element.is_a()
+        try:
+            return self._cache[cls]
+        except KeyError:
+            resolved = next((t for t in self.types if element.is_a(t)), None)
+            self._cache[cls] = resolved
+            return resolved
+
+
+def iter_elements(filepath, batch_size=1000, workers=None, spec=None, stage=None, progress=None, geometry=None):
     """
+    IFCファイルから部材情報を抽出し、一定数ずつまとめて返す
+
+    抽出結果全体をリストに保持しないため、要素数に関わらずメモリ使用量は
+    IFCモデル本体とバッチ1つ分に抑えられる（並列抽出の場合を除く）。
+
+    Args:
+        filepath (str): IFCファイルのパス
+        batch_size (int): 1回に返す行数
+        workers (int): 並列抽出に使うプロセス数（Noneまたは1なら単一プロセス）
+            並列抽出では各プロセスの結果をまとめて受け取るため、メモリは抑えられない
+        spec (dict): 抽出仕様（Noneなら既定の仕様、extraction_spec参照）
+        stage (callable): 段階名を受け取り計測用のコンテキストマネージャを返す関数
+        progress (callable): 進捗を (段階名, 処理済み数, 総数) で受け取る関数
+            （総数が分からない段階では処理済み数・総数ともNone）
+        geometry (GeometryOptions): 指定した場合、数量セット・プロパティから長さ・重量が
+            得られない要素は形状から求める（geometry参照）
+
+    Yields:
+        list: ElementRowのリスト（ファイル内の要素の順序。並列抽出でも同じ順序になる）
+    """
+    import ifcopenshell
+
+    spec = DEFAULT_SPEC if spec is None else spec
+    stage = stage or _no_stage
+    progress = progress or _no_progress
     try:
-        ifc_file = ifcopenshell.open(filepath)
-        elements = []
-
-        # BeamとColumnの要素を取得
-        beams = ifc_file.by_type('IfcBeam')
-        columns = ifc_file.by_type('IfcColumn')
-
-        # Beamの情報を処理
-        for beam in beams:
-            try:
-                properties = {
-                    "type": "IfcBeam",
-                    "name": beam.Name if hasattr(beam, 'Name') else "未定義",
-                    "description": beam.Description if hasattr(beam, 'Description') else "未定義",
-                    "size": extract_profile_information(beam),
-                    "weight": get_weight(beam),
-                    "length": get_length(beam)
-                }
-                elements.append(properties)
-            except Exception as e:
-                logger.warning(f"Beam {beam.id()} の処理中にエラーが発生: {str(e)}")
-                continue
+        if workers and workers > 1:
+            with stage('extract_parallel'):
+                rows = _process_parallel(filepath, workers, spec, progress, geometry)
+            for start in range(0, len(rows), batch_size):
+                yield rows[start:start + batch_size]
+            return
 
-        # Columnの情報を処理
-        for column in columns:
-            try:
-                properties = {
-                    "type": "IfcColumn",
-                    "name": column.Name if hasattr(column, 'Name') else "未定義",
-                    "description": column.Description if hasattr(column, 'Description') else "未定義",
-                    "size": extract_profile_information(column),
-                    "weight": get_weight(column),
-                    "length": get_length(column)
-                }
-                elements.append(properties)
-            except Exception as e:
-                logger.warning(f"Column {column.id()} の処理中にエラーが発生: {str(e)}")
-                continue
+        progress('open', None, None)
+        with stage('open'):
+            ifc_file = ifcopenshell.open(filepath)
+        progress('index', None, None)
+        with stage('index'):
+            # 関連付けの索引を作成（要素ごとの逆参照を避ける）
+            relation_index = build_relation_index(ifc_file)
+
+        compiled = compile_spec(spec)
+        resolve_type = _TypeResolver(tuple(spec))
+        elements = ifc_file.by_type('IfcElement')
+        total = len(elements)
 
-        return elements
+        quantities = {}
+        if geometry is not None:
+            progress('geometry', None, None)
+            with stage('geometry'):
+                quantities = _geometry_quantities(ifc_file, geometry, elements, resolve_type)
+
+        # 要素を一度だけ走査し、抽出仕様の種別（サブタイプが複数の種別に該当する場合は
+        # 先に定義された種別）に該当するものを取り出す
+        batch = []
+        for done, element in enumerate(elements):
+            if done % PROGRESS_EVERY == 0:
+                progress('extract', done, total)
+            ifc_type = resolve_type(element)
+            if ifc_type is None:
+                continue
+            row = _extract_row(ifc_type, compiled[ifc_type], element, relation_index, quantities)
+            if row is None:
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        progress('extract', total, total)
+        if batch:
+            yield batch
 
     except Exception as e:
         logger.error(f"IFCファイルの処理中にエラーが発生: {str(e)}")
         raise
 
-def extract_profile_information(element):
-    """部材のプロファイル情報を抽出"""
-    try:
-        # まず、Description属性をチェック
-        if hasattr(element, 'Description') and element.Description:
-            return element.Description
-
-        # PropertySetから情報を取得
-        for rel in element.IsDefinedBy:
-            if rel.is_a("IfcRelDefinesByProperties"):
-                property_set = rel.RelatingPropertyDefinition
-                if property_set.is_a("IfcPropertySet"):
-                    for prop in property_set.HasProperties:
-                        # 断面性能に関連するpropertyを検索
-                        if any(keyword in prop.Name.lower() for keyword in ["section", "profile", "size"]):
-                            if hasattr(prop, "NominalValue"):
-                                return prop.NominalValue.wrappedValue
-
-        # 材料プロファイルから情報を取得
-        for rel in element.HasAssociations:
-            if rel.is_a("IfcRelAssociatesMaterial"):
-                material = rel.RelatingMaterial
-                if material.is_a("IfcMaterialProfileSet"):
-                    for profile in material.MaterialProfiles:
-                        if profile.Profile:
-                            return profile.Profile.ProfileName
-
-        return "未定義"
-    except:
-        return "未定義"
-
-def get_weight(element):
-    """部材の重量情報を抽出"""
-    try:
-        for rel in element.IsDefinedBy:
-            if rel.is_a('IfcRelDefinesByProperties'):
-                property_set = rel.RelatingPropertyDefinition
-                if property_set.is_a('IfcPropertySet'):
-                    for prop in property_set.HasProperties:
-                        if prop.Name.lower() in ['weight', 'mass']:
-                            if hasattr(prop, 'NominalValue'):
-                                return prop.NominalValue.wrappedValue
-        return "未定義"
-    except:
-        return "未定義"
-
-def get_length(element):
-    """部材の長さ情報を抽出"""
+def process_ifc_file(filepath, workers=None, spec=None, stage=None, progress=None, geometry=None):
+    """
+    IFCファイルを処理して部材情報を抽出する（iter_elementsの結果をまとめて返す）
+
+    Returns:
+        list: ElementRowのリスト（ファイル内の要素の順序）
+    """
+    elements = []
+    for batch in iter_elements(filepath, workers=workers, spec=spec, stage=stage, progress=progress,
+                               geometry=geometry):
+        elements.extend(batch)
+    return elements
+
+def _extract_row(ifc_type, accessors, element, relation_index, quantities=None):
+    """
+    1要素の部材情報を取り出す（取り出せない場合はNone）
+
+    quantitiesに形状から求めた (長さ, 重量) があれば、値のない長さ・重量を補う。
+    """
     try:
-        for rel in element.IsDefinedBy:
-            if rel.is_a('IfcRelDefinesByProperties'):
-                property_set = rel.RelatingPropertyDefinition
-                if property_set.is_a('IfcElementQuantity'):
-                    for q in property_set.Quantities:
-                        if q.is_a('IfcQuantityLength'):
-                            return q.LengthValue
-        return "未定義"
-    except:
-        return "未定義"
+        relations = relation_index.get(element.id(), _EMPTY_RELATIONS)
+        row = ElementRow(ifc_type, element.GlobalId,
+                         *[accessor(element, relations) for accessor in accessors])
+    except Exception as e:
+        logger.warning(f"{ifc_type} {element.id()} の処理中にエラーが発生: {str(e)}")
+        return None
+    quantity = quantities.get(element.id()) if quantities else None
+    if quantity is not None and (row.length is None or row.weight is None):
+        length, weight = quantity
+        row = row._replace(length=row.length if row.length is not None else length,
+                           weight=row.weight if row.weight is not None else weight)
+    return row
+
+def _geometry_quantities(ifc_file, geometry, elements, resolve_type):
+    """抽出する要素のうち形状から数量を求める種別の要素について、長さと重量をまとめて求める"""
+    from .geometry import compute_quantities
+
+    targets = [element for element in elements if resolve_type(element) in geometry.types]
+    return compute_quantities(ifc_file, targets, geometry.threads, geometry.default_density)
+
+def _extract_elements(spec, elements, relation_index, quantities=None):
+    """要素を一度だけ走査し、抽出仕様に該当するものの部材情報を要素の順序で返す"""
+    compiled = compile_spec(spec)
+    resolve_type = _TypeResolver(tuple(spec))
+
+    results = []
+    for element in elements:
+        ifc_type = resolve_type(element)
+        if ifc_type is None:
+            continue
+        row = _extract_row(ifc_type, compiled[ifc_type], element, relation_index, quantities)
+        if row is not None:
+            results.append(row)
+    return results
+
+def _process_parallel(filepath, workers, spec, progress=_no_progress, geometry=None):
+    """
+    要素をID順の連続した範囲へ分割し、プロセスプールで並列に抽出する
+
+    各ワーカーはファイルを個別に開き、担当範囲の結果だけを返す。
+    結果は範囲順に結合するため、単一プロセスと同じ順序（ファイル内の要素の順序）になる。
+    進捗は完了した範囲の数で通知する。
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    progress('extract_parallel', 0, workers)
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = {
+            executor.submit(_extract_chunk, filepath, index, workers, spec, geometry): index
+            for index in range(workers)
+        }
+        chunks = [None] * workers
+        for done, future in enumerate(as_completed(futures), start=1):
+            chunks[futures[future]] = future.result()
+            progress('extract_parallel', done, workers)
+
+    elements = [row for chunk in chunks for row in chunk]
+    logger.debug(f"{workers} プロセスで {len(elements)} 要素を抽出しました")
+    return elements
+
+def _extract_chunk(filepath, chunk_index, chunk_count, spec, geometry=None):
+    """ワーカープロセスで担当範囲の要素を抽出する"""
+    import ifcopenshell
+
+    ifc_file = ifcopenshell.open(filepath)
+    elements = ifc_file.by_type('IfcElement')
+    start = len(elements) * chunk_index // chunk_count
+    stop = len(elements) * (chunk_index + 1) // chunk_count
+    chunk = elements[start:stop]
+
+    quantities = None
+    if geometry is not None:
+        # 各プロセスは担当範囲の要素の形状だけを処理する
+        quantities = _geometry_quantities(ifc_file, geometry, chunk, _TypeResolver(tuple(spec)))
+    return _extract_elements(spec, chunk, build_relation_index(ifc_file, chunk), quantities)
+
+def cache_version(spec=None, geometry=None):
+    """解析結果キャッシュのキーに使う、解析器・抽出仕様・形状から数量を求める設定のバージョン"""
+    from .geometry import options_fingerprint
+
+    version = f"{PARSER_VERSION}.{spec_fingerprint(DEFAULT_SPEC if spec is None else spec)}"
+    if geometry is not None:
+        version += f".{options_fingerprint(geometry)}"
+    return version
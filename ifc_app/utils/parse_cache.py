@@ -0,0 +1,158 @@
+import os
+import gzip
+import json
+import uuid
+import logging
+from .extraction_spec import ElementRow
+
+logger = logging.getLogger(__name__)
+
+
+class ParseCache:
+    """
+    ファイルハッシュと解析器のバージョンをキーにした解析結果のキャッシュ
+
+    結果は1行1要素のJSON配列（gzip圧縮）としてディレクトリに保存し、
+    読み書きとも1行ずつ行うため結果全体をメモリに載せない。
+    合計サイズが上限を超えたら最終利用時刻（mtime）の古いものから削除する。
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(file_hash, parser_version):
+        return f"{file_hash}-{parser_version}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.ndjson.gz")
+
+    def contains(self, key):
+        """キャッシュが存在するか（読み込めるかは確認しない）"""
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """
+        キャッシュされた要素を1行ずつ返すイテレータを返す（存在しなければNone）
+
+        読み込み途中でファイルの破損が分かった場合は、ファイルを削除して例外を送出する。
+        """
+        path = self._path(key)
+        try:
+            f = gzip.open(path, 'rt', encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"キャッシュ {key} の読み込みに失敗しました: {str(e)}")
+            return None
+
+        # LRU判定のため最終利用時刻を更新
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        logger.debug(f"キャッシュヒット: {key}")
+        return self._iter_rows(key, path, f)
+
+    def _iter_rows(self, key, path, f):
+        try:
+            with f:
+                for line in f:
+                    yield ElementRow(*json.loads(line))
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"キャッシュ {key} が破損しているため削除します: {str(e)}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            raise
+
+    def writer(self, key):
+        """要素を少しずつ書き込むためのCacheWriterを返す（withブロックの正常終了時に保存する）"""
+        return CacheWriter(self, key)
+
+    def put(self, key, rows):
+        """要素を保存し、上限を超えた分を削除する"""
+        with self.writer(key) as writer:
+            writer.write(rows)
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            # 旧形式（.json.gz）のファイルも容量に含めて古い順に削除する
+            if not entry.name.endswith('.gz'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                logger.debug(f"キャッシュを削除しました: {os.path.basename(path)}")
+            except FileNotFoundError:
+                pass
+
+
+class CacheWriter:
+    """
+    一時ファイルに書き込み、完了時にキャッシュへ置き換える
+
+    書き込みに失敗しても例外は送出せず、キャッシュを作成しないだけとする
+    （解析結果の保存をキャッシュの失敗で中断しないため）。
+    """
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.path = cache._path(key)
+        self.tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        self._file = None
+        self.failed = False
+
+    def __enter__(self):
+        try:
+            self._file = gzip.open(self.tmp_path, 'wt', encoding='utf-8')
+        except OSError as e:
+            self._fail(e)
+        return self
+
+    def _fail(self, error):
+        logger.warning(f"キャッシュ {self.key} の書き込みに失敗しました: {str(error)}")
+        self.failed = True
+
+    def write(self, rows):
+        if self.failed:
+            return
+        try:
+            for row in rows:
+                self._file.write(json.dumps(row, ensure_ascii=False))
+                self._file.write('\n')
+        except OSError as e:
+            self._fail(e)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._file is not None:
+                self._file.close()
+            if exc_type is None and not self.failed:
+                os.replace(self.tmp_path, self.path)
+                self.cache._evict()
+                return False
+        except OSError as e:
+            self._fail(e)
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+        return False
@@ -0,0 +1,139 @@
+"""
+解析処理のプロファイル取得と変換
+
+cProfileで取得した統計情報をpstats形式で保存し、ダウンロード時に
+必要であればspeedscope（https://www.speedscope.app）のJSON形式へ変換する。
+"""
+import os
+import pstats
+import logging
+import cProfile
+
+logger = logging.getLogger(__name__)
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+# speedscopeへの変換で省略する呼び出しの割合と呼び出しの深さの上限
+_MIN_FRACTION = 0.001
+_MAX_DEPTH = 128
+
+
+def profile_call(path, func, *args, **kwargs):
+    """
+    関数をcProfileの下で実行し、統計情報をpstats形式で保存する
+
+    例外が発生した場合も、それまでの統計情報は保存する。
+
+    Args:
+        path (str): 保存先のパス
+        func (callable): 実行する関数
+
+    Returns:
+        関数の戻り値
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        profiler.dump_stats(path)
+        logger.debug(f"プロファイルを保存しました: {path}")
+
+
+def _frame_name(func):
+    filename, line, name = func
+    if filename == '~':
+        # 組み込み関数は ('~', 0, '<built-in method ...>') の形式
+        return name, None, None
+    return name, filename, line
+
+
+def pstats_to_speedscope(path, name='profile'):
+    """
+    pstats形式のファイルをspeedscopeのevented形式に変換する
+
+    cProfileは呼び出し元ごとの累計時間しか持たないため、呼び出し元から
+    呼び出し先への時間を比例配分して呼び出しツリーを再構成する（近似）。
+
+    Args:
+        path (str): pstats形式のファイル
+        name (str): プロファイルの表示名
+
+    Returns:
+        dict: speedscopeのファイル形式
+    """
+    stats = pstats.Stats(path).stats
+
+    # 呼び出し元 -> [(呼び出し先, その呼び出し元からの累計時間)]
+    children = {}
+    roots = []
+    for func, (_, _, _, cumulative, callers) in stats.items():
+        if not callers:
+            roots.append((func, cumulative))
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    for calls in children.values():
+        calls.sort(key=lambda item: item[1], reverse=True)
+    roots.sort(key=lambda item: item[1], reverse=True)
+
+    total = sum(cumulative for _, cumulative in roots)
+    min_duration = total * _MIN_FRACTION
+
+    frames = []
+    frame_index = {}
+    events = []
+
+    def frame_for(func):
+        index = frame_index.get(func)
+        if index is None:
+            frame_name, filename, line = _frame_name(func)
+            frame = {'name': frame_name}
+            if filename:
+                frame['file'] = filename
+                frame['line'] = line
+            index = frame_index[func] = len(frames)
+            frames.append(frame)
+        return index
+
+    def emit(func, start, duration, stack):
+        frame = frame_for(func)
+        events.append({'type': 'O', 'frame': frame, 'at': start})
+        cumulative = stats[func][3]
+        if len(stack) < _MAX_DEPTH and cumulative > 0:
+            scale = duration / cumulative
+            cursor = start
+            end = start + duration
+            for callee, edge_cumulative in children.get(func, ()):
+                # 再帰呼び出しは展開しない
+                if callee in stack:
+                    continue
+                child_duration = min(edge_cumulative * scale, end - cursor)
+                if child_duration < min_duration:
+                    continue
+                stack.add(callee)
+                emit(callee, cursor, child_duration, stack)
+                stack.discard(callee)
+                cursor += child_duration
+        events.append({'type': 'C', 'frame': frame, 'at': start + duration})
+
+    cursor = 0.0
+    for func, cumulative in roots:
+        if cumulative < min_duration:
+            continue
+        emit(func, cursor, cumulative, {func})
+        cursor += cumulative
+
+    return {
+        '$schema': SPEEDSCOPE_SCHEMA,
+        'name': name,
+        'exporter': 'ifc-converter',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'evented',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': cursor,
+            'events': events,
+        }],
+    }
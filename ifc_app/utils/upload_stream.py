@@ -0,0 +1,116 @@
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ISO-10303-21（STEP物理ファイル）の先頭に現れる識別子
+STEP_MAGIC = b'ISO-10303-21;'
+UTF8_BOM = b'\xef\xbb\xbf'
+HEAD_SIZE = len(UTF8_BOM) + len(STEP_MAGIC)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadRejected(Exception):
+    """アップロードされた内容がIFCファイルとして受け付けられない場合の例外"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StreamingUpload:
+    """
+    受信したデータをファイルに追記しながらハッシュ計算と内容の検証を行う
+
+    先頭のバイト列がISO-10303-21のヘッダーでない場合や、上限サイズ・宣言された
+    ファイルサイズを超えた場合はその時点でUploadRejectedを送出する。
+    """
+
+    def __init__(self, filepath, max_bytes, offset=0, expected_size=None):
+        self.filepath = filepath
+        self.max_bytes = max_bytes
+        self.expected_size = expected_size
+        self.offset = offset
+        # 途中から再開する場合、ハッシュは完了時にファイルから計算する
+        self.digest = hashlib.sha256() if offset == 0 else None
+        # ヘッダーは最初のリクエストで検証済み
+        self._head = None if offset else b''
+
+    def write_stream(self, stream, chunk_size=CHUNK_SIZE):
+        """ストリームを最後まで読み込んでファイルに追記する"""
+        mode = 'wb' if self.offset == 0 else 'r+b'
+        with open(self.filepath, mode) as out:
+            # 前回の送信が途中で切れた場合に備え、確定済みの位置から書き込む
+            out.seek(self.offset)
+            out.truncate()
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                if self.offset + len(chunk) > self.max_bytes:
+                    raise UploadRejected(
+                        f"ファイルサイズが上限（{self.max_bytes // (1024 * 1024)}MB）を超えています", 413)
+                if self.expected_size is not None and self.offset + len(chunk) > self.expected_size:
+                    raise UploadRejected('送信されたデータが宣言されたファイルサイズを超えています')
+                if self._head is not None:
+                    self._check_head(chunk)
+                out.write(chunk)
+                if self.digest is not None:
+                    self.digest.update(chunk)
+                self.offset += len(chunk)
+
+        # ヘッダーに満たない長さで終わった場合
+        if self._head is not None:
+            self._validate_head()
+        return self.offset
+
+    def _check_head(self, chunk):
+        # 先頭部分が揃った時点でヘッダーを検証する
+        self._head += chunk[:HEAD_SIZE - len(self._head)]
+        if len(self._head) >= HEAD_SIZE:
+            self._validate_head()
+
+    def _validate_head(self):
+        head = self._head.removeprefix(UTF8_BOM)
+        if not head.startswith(STEP_MAGIC):
+            raise UploadRejected('IFCファイル（ISO-10303-21形式）ではありません')
+        self._head = None
+
+    def hexdigest(self):
+        """ファイル全体のSHA-256を返す（再開時のハッシュ状態がなければ読み直す）"""
+        if self.digest is None:
+            self.digest = hash_file(self.filepath)
+        return self.digest.hexdigest()
+
+
+def hash_file(filepath, chunk_size=CHUNK_SIZE):
+    """ファイルを読み込んでSHA-256のハッシュオブジェクトを返す"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest
+
+
+def receive_stream(stream, filepath, max_bytes):
+    """
+    ストリームを検証しながらファイルに保存し、SHA-256を返す
+
+    Args:
+        stream: 読み込み元のファイルオブジェクト
+        filepath (str): 保存先のパス
+        max_bytes (int): 受け付ける最大サイズ
+
+    Returns:
+        str: ファイル内容のSHA-256（16進数）
+
+    Raises:
+        UploadRejected: IFCファイルでない場合、またはサイズ上限を超えた場合
+    """
+    upload = StreamingUpload(filepath, max_bytes)
+    upload.write_stream(stream)
+    return upload.hexdigest()
@@ -3,4 +3,8 @@ from ifc_app import create_app
 app = create_app()
 
 if __name__ == '__main__':
+    # 開発用サーバーでは起動時にテーブルを作成する（本番は flask --app main ifc init-db）
+    from ifc_app.db import init_db
+    with app.app_context():
+        init_db()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
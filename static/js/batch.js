@@ -0,0 +1,73 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // 一括解析の各ファイルの状況を定期的に更新する
+    const container = document.getElementById('batchStatus');
+    if (!container || container.dataset.finished === 'true') {
+        return;
+    }
+
+    const statusUrl = container.dataset.statusUrl;
+    const rows = document.getElementById('batchFiles');
+    const summary = document.getElementById('batchSummary');
+    const running = document.getElementById('batchRunning');
+    const pollInterval = 2000;
+
+    const statusLabels = {
+        queued: '待機中',
+        running: '解析中',
+        done: '完了'
+    };
+
+    function statusCell(file) {
+        const cell = document.createElement('td');
+        if (file.status === 'failed') {
+            const span = document.createElement('span');
+            span.className = 'text-danger';
+            span.textContent = `失敗: ${file.error || ''}`;
+            cell.appendChild(span);
+            return cell;
+        }
+        let label = statusLabels[file.status] || file.status;
+        if (file.status === 'running' && file.stage === 'extract' && file.progress_total) {
+            label += ` (${Math.floor(file.progress_done / file.progress_total * 100)}%)`;
+        }
+        cell.textContent = label;
+        return cell;
+    }
+
+    function render(batch) {
+        rows.replaceChildren(...batch.files.map(file => {
+            const row = document.createElement('tr');
+            const name = document.createElement('td');
+            if (file.preview_url) {
+                const link = document.createElement('a');
+                link.href = file.preview_url;
+                link.className = 'text-decoration-none';
+                link.textContent = file.filename;
+                name.appendChild(link);
+            } else {
+                name.textContent = file.filename;
+            }
+            const count = document.createElement('td');
+            count.className = 'text-end';
+            count.textContent = file.element_count === null || file.element_count === undefined ? '' : file.element_count;
+            row.append(name, statusCell(file), count);
+            return row;
+        }));
+        summary.textContent = `${batch.files.length} ファイル、${batch.element_count} 要素`;
+        running.hidden = batch.finished;
+    }
+
+    function poll() {
+        fetch(statusUrl, { headers: { 'Accept': 'application/json' } })
+            .then(response => response.json())
+            .then(batch => {
+                render(batch);
+                if (!batch.finished) {
+                    setTimeout(poll, pollInterval);
+                }
+            })
+            .catch(() => setTimeout(poll, pollInterval * 3));
+    }
+
+    setTimeout(poll, pollInterval);
+});
@@ -0,0 +1,109 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // 解析ジョブの進捗を表示し、完了したらプレビューへ移動する
+    const container = document.getElementById('jobStatus');
+    if (!container) {
+        return;
+    }
+
+    const statusUrl = container.dataset.statusUrl;
+    const eventsUrl = container.dataset.eventsUrl;
+    const running = document.getElementById('jobRunning');
+    const failed = document.getElementById('jobFailed');
+    const errorText = document.getElementById('jobError');
+    const stageText = document.getElementById('jobStage');
+    const progress = document.getElementById('jobProgress');
+    const progressBar = progress.querySelector('.progress-bar');
+    const pollInterval = 1000;
+
+    const stageLabels = {
+        cached: '解析済みの結果から保存しています...',
+        open: 'ファイルを読み込んでいます...',
+        index: '関連情報を整理しています...',
+        geometry: '形状から長さ・重量を計算しています...',
+        extract: '部材情報を抽出しています',
+        extract_parallel: '部材情報を抽出しています',
+        persist: '解析結果を保存しています...'
+    };
+
+    function showFailure(message) {
+        running.hidden = true;
+        failed.hidden = false;
+        errorText.textContent = message || '';
+    }
+
+    function showProgress(job) {
+        if (job.status === 'queued') {
+            stageText.textContent = job.stage === 'memory_wait'
+                ? '実行中の解析が終わるのを待っています（メモリ不足を避けるため）...'
+                : '解析の順番を待っています...';
+            return;
+        }
+        let label = stageLabels[job.stage] || '解析中です。このままお待ちください...';
+        if (job.stage === 'open' && job.entity_count) {
+            // 読み込み中は進捗が分からないため、事前走査したエンティティ数を表示する
+            label = `ファイルを読み込んでいます（${job.entity_count.toLocaleString()} エンティティ）...`;
+        }
+        if (job.progress_total) {
+            const percent = Math.floor(job.progress_done / job.progress_total * 100);
+            progress.hidden = false;
+            progressBar.style.width = `${percent}%`;
+            progressBar.setAttribute('aria-valuenow', percent);
+            if (job.stage === 'extract') {
+                label += ` (${job.progress_done.toLocaleString()} / ${job.progress_total.toLocaleString()})`;
+            } else {
+                label += ` (${percent}%)`;
+            }
+        } else {
+            progress.hidden = true;
+        }
+        stageText.textContent = label;
+    }
+
+    // 状態を反映し、完了・失敗した場合はtrueを返す
+    function update(job) {
+        if (job.status === 'done') {
+            window.location.href = job.preview_url;
+            return true;
+        }
+        if (job.status === 'failed') {
+            showFailure(job.error);
+            return true;
+        }
+        showProgress(job);
+        return false;
+    }
+
+    function poll() {
+        fetch(statusUrl, { headers: { 'Accept': 'application/json' } })
+            .then(response => response.json())
+            .then(job => {
+                if (!update(job)) {
+                    setTimeout(poll, pollInterval);
+                }
+            })
+            .catch(() => setTimeout(poll, pollInterval * 3));
+    }
+
+    function listen() {
+        const source = new EventSource(eventsUrl);
+        source.onmessage = function(event) {
+            if (update(JSON.parse(event.data))) {
+                source.close();
+            }
+        };
+        source.onerror = function() {
+            // 接続できない場合はポーリングに切り替える（接続中の切断はEventSourceが再接続する）
+            if (source.readyState === EventSource.CLOSED) {
+                poll();
+            }
+        };
+    }
+
+    if (container.dataset.status !== 'failed') {
+        if (window.EventSource && eventsUrl) {
+            listen();
+        } else {
+            poll();
+        }
+    }
+});
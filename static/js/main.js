@@ -1,3 +1,109 @@
+// 分割アップロードの再送回数
+const MAX_CHUNK_RETRIES = 5;
+// ページのURLに ?profile=1 があれば解析のプロファイルを要求する
+const PROFILE_REQUESTED = new URLSearchParams(window.location.search).get('profile') === '1';
+
+function sendRequest(method, url, body, onProgress) {
+    // XMLHttpRequestをPromiseで扱い、JSONのレスポンスを返す
+    return new Promise((resolve, reject) => {
+        const xhr = new XMLHttpRequest();
+        xhr.open(method, url, true);
+        xhr.setRequestHeader('Accept', 'application/json');
+        if (PROFILE_REQUESTED) {
+            xhr.setRequestHeader('X-IFC-Profile', '1');
+        }
+        if (body !== null && !(body instanceof Blob)) {
+            xhr.setRequestHeader('Content-Type', 'application/json');
+            body = JSON.stringify(body);
+        } else if (body instanceof Blob) {
+            xhr.setRequestHeader('Content-Type', 'application/octet-stream');
+        }
+        if (onProgress) {
+            xhr.upload.addEventListener('progress', onProgress);
+        }
+        xhr.addEventListener('load', function() {
+            let data = {};
+            try {
+                data = JSON.parse(xhr.responseText);
+            } catch (e) {
+                data = {};
+            }
+            resolve({ status: xhr.status, data: data });
+        });
+        xhr.addEventListener('error', () => reject(new Error('network')));
+        xhr.send(body);
+    });
+}
+
+async function uploadInChunks(baseUrl, file, onProgress) {
+    // 中断したアップロードはファイル名・サイズ・更新日時で識別して再開する
+    const storageKey = `ifc-upload:${file.name}:${file.size}:${file.lastModified}`;
+    let session = null;
+
+    const savedToken = localStorage.getItem(storageKey);
+    if (savedToken) {
+        const saved = await sendRequest('GET', `${baseUrl}/${savedToken}`, null);
+        if (saved.status === 200) {
+            session = saved.data;
+        }
+    }
+    if (!session) {
+        const created = await sendRequest('POST', baseUrl, { filename: file.name, size: file.size });
+        if (created.status !== 201) {
+            throw new Error(created.data.error || 'アップロード中にエラーが発生しました');
+        }
+        session = created.data;
+        localStorage.setItem(storageKey, session.token);
+    }
+
+    const uploadUrl = `${baseUrl}/${session.token}`;
+    const chunkSize = session.chunk_size || 5 * 1024 * 1024;
+    let offset = session.received;
+    let retries = 0;
+
+    while (offset < file.size) {
+        const chunk = file.slice(offset, offset + chunkSize);
+        const start = offset;
+        let result;
+        try {
+            result = await sendRequest('PUT', `${uploadUrl}?offset=${offset}`, chunk, e => {
+                if (e.lengthComputable) {
+                    onProgress(start + e.loaded, file.size);
+                }
+            });
+        } catch (e) {
+            // 通信エラーはサーバーの受信位置を確認してから再送する
+            if (++retries > MAX_CHUNK_RETRIES) {
+                throw new Error('通信が途切れました。もう一度アップロードすると続きから再開します');
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            const status = await sendRequest('GET', uploadUrl, null).catch(() => null);
+            if (status && status.status === 200) {
+                offset = status.data.received;
+            }
+            continue;
+        }
+
+        if (result.status === 200 || result.status === 409) {
+            offset = result.data.received;
+            retries = 0;
+            onProgress(offset, file.size);
+        } else {
+            if (result.status === 400 || result.status === 404 || result.status === 410 || result.status === 413) {
+                localStorage.removeItem(storageKey);
+            }
+            throw new Error(result.data.error || 'アップロード中にエラーが発生しました');
+        }
+    }
+
+    const completed = await sendRequest('POST', `${uploadUrl}/complete`, {});
+    localStorage.removeItem(storageKey);
+    if (completed.status !== 200) {
+        throw new Error(completed.data.error || 'ファイルの処理中にエラーが発生しました');
+    }
+    return completed.data.redirect_url;
+}
+
 document.addEventListener('DOMContentLoaded', function() {
     // ファイルアップロードフォームの処理
     const uploadForms = document.querySelectorAll('#uploadForm');
@@ -13,6 +119,8 @@ document.addEventListener('DOMContentLoaded', function() {
                  aria-valuenow="0" aria-valuemin="0" aria-valuemax="100">0%</div>
         `;
 
+        const maxSize = parseInt(form.dataset.maxSize, 10) || 100 * 1024 * 1024;
+
         if (fileInput) {
             // プログレスバーをファイル入力の後に挿入
             fileInput.parentNode.insertBefore(progressContainer, fileInput.nextSibling);
@@ -23,8 +131,8 @@ document.addEventListener('DOMContentLoaded', function() {
                     if (!file.name.toLowerCase().endsWith('.ifc')) {
                         alert('IFCファイルを選択してください');
                         this.value = '';
-                    } else if (file.size > 100 * 1024 * 1024) { // 100MB
-                        alert('ファイルサイズは100MB以下にしてください');
+                    } else if (file.size > maxSize) {
+                        alert(`ファイルサイズは${Math.floor(maxSize / (1024 * 1024))}MB以下にしてください`);
                         this.value = '';
                     }
                 }
@@ -32,11 +140,32 @@ document.addEventListener('DOMContentLoaded', function() {
         }
 
         if (form) {
+            const resetForm = function() {
+                if (uploadBtn) {
+                    uploadBtn.disabled = false;
+                    if (spinner) {
+                        spinner.classList.add('d-none');
+                    }
+                    uploadBtn.textContent = 'アップロードして解析';
+                }
+                progressContainer.classList.add('d-none');
+            };
+
+            const updateProgress = function(loaded, total) {
+                const percentComplete = (loaded / total) * 100;
+                const progressBar = progressContainer.querySelector('.progress-bar');
+                progressBar.style.width = percentComplete + '%';
+                progressBar.setAttribute('aria-valuenow', percentComplete);
+                progressBar.textContent = Math.round(percentComplete) + '%';
+            };
+
             form.addEventListener('submit', function(e) {
                 e.preventDefault();
 
-                const formData = new FormData(this);
-                const xhr = new XMLHttpRequest();
+                const file = fileInput ? fileInput.files[0] : null;
+                if (!file) {
+                    return;
+                }
 
                 // プログレスバーの表示
                 progressContainer.classList.remove('d-none');
@@ -51,46 +180,15 @@ document.addEventListener('DOMContentLoaded', function() {
                     }
                 }
 
-                xhr.upload.addEventListener('progress', function(e) {
-                    if (e.lengthComputable) {
-                        const percentComplete = (e.loaded / e.total) * 100;
-                        const progressBar = progressContainer.querySelector('.progress-bar');
-                        progressBar.style.width = percentComplete + '%';
-                        progressBar.setAttribute('aria-valuenow', percentComplete);
-                        progressBar.textContent = Math.round(percentComplete) + '%';
-                    }
-                });
-
-                xhr.addEventListener('load', function() {
-                    if (xhr.status === 200 || xhr.status === 302) {
-                        window.location.href = xhr.responseURL || xhr.response;
-                    } else {
-                        alert('アップロード中にエラーが発生しました');
-                        if (uploadBtn) {
-                            uploadBtn.disabled = false;
-                            if (spinner) {
-                                spinner.classList.add('d-none');
-                            }
-                            uploadBtn.textContent = 'アップロードして解析';
-                        }
-                        progressContainer.classList.add('d-none');
-                    }
-                });
-
-                xhr.addEventListener('error', function() {
-                    alert('アップロード中にエラーが発生しました');
-                    if (uploadBtn) {
-                        uploadBtn.disabled = false;
-                        if (spinner) {
-                            spinner.classList.add('d-none');
-                        }
-                        uploadBtn.textContent = 'アップロードして解析';
-                    }
-                    progressContainer.classList.add('d-none');
-                });
-
-                xhr.open('POST', form.action, true);
-                xhr.send(formData);
+                // ファイルを分割して送信し、完了後に解析状況のページへ移動する
+                uploadInChunks(form.dataset.chunkedUrl, file, updateProgress)
+                    .then(redirectUrl => {
+                        window.location.href = redirectUrl;
+                    })
+                    .catch(error => {
+                        alert(error.message || 'アップロード中にエラーが発生しました');
+                        resetForm();
+                    });
             });
         }
     });
@@ -0,0 +1,126 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // 解析結果をAPIから1ページずつ読み込んで表示する
+    const container = document.getElementById('elementTable');
+    if (!container) {
+        return;
+    }
+
+    const apiUrl = container.dataset.apiUrl;
+    const pageSize = parseInt(container.dataset.pageSize, 10) || 100;
+    const columns = ['type', 'name', 'size', 'weight', 'length'];
+    const rows = document.getElementById('elementRows');
+    const filterInput = document.getElementById('elementFilter');
+    const summary = document.getElementById('elementSummary');
+    const pageInfo = document.getElementById('pageInfo');
+    const prevBtn = document.getElementById('prevPage');
+    const nextBtn = document.getElementById('nextPage');
+    const headers = container.querySelectorAll('th.sortable');
+
+    const state = { offset: 0, sort: '', filter: '', total: 0 };
+    let requestId = 0;
+    let filterTimer = null;
+
+    function showMessage(message) {
+        rows.innerHTML = '';
+        const tr = document.createElement('tr');
+        const td = document.createElement('td');
+        td.colSpan = columns.length;
+        td.className = 'text-center text-muted';
+        td.textContent = message;
+        tr.appendChild(td);
+        rows.appendChild(tr);
+    }
+
+    function render(data) {
+        state.total = data.total;
+        if (data.elements.length === 0) {
+            showMessage('該当する部材がありません');
+        } else {
+            const fragment = document.createDocumentFragment();
+            data.elements.forEach(element => {
+                const tr = document.createElement('tr');
+                columns.forEach(column => {
+                    const td = document.createElement('td');
+                    const value = element[column];
+                    td.textContent = value === null || value === undefined ? '' : value;
+                    tr.appendChild(td);
+                });
+                fragment.appendChild(tr);
+            });
+            rows.innerHTML = '';
+            rows.appendChild(fragment);
+        }
+
+        const first = data.total === 0 ? 0 : state.offset + 1;
+        const last = Math.min(state.offset + pageSize, data.total);
+        summary.textContent = `全 ${data.total} 件`;
+        pageInfo.textContent = `${first} - ${last} 件目`;
+        prevBtn.disabled = state.offset === 0;
+        nextBtn.disabled = state.offset + pageSize >= data.total;
+        container.querySelector('.table-container').scrollTop = 0;
+    }
+
+    function load() {
+        const params = new URLSearchParams({ offset: state.offset, limit: pageSize });
+        if (state.sort) {
+            params.set('sort', state.sort);
+        }
+        if (state.filter) {
+            params.set('filter', state.filter);
+        }
+
+        // 古いリクエストの結果で上書きしないよう最新のものだけ反映する
+        const current = ++requestId;
+        fetch(`${apiUrl}?${params}`, { headers: { 'Accept': 'application/json' } })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                return response.json();
+            })
+            .then(data => {
+                if (current === requestId) {
+                    render(data);
+                }
+            })
+            .catch(() => {
+                if (current === requestId) {
+                    showMessage('データの読み込み中にエラーが発生しました');
+                }
+            });
+    }
+
+    headers.forEach(th => {
+        th.addEventListener('click', function() {
+            const key = this.dataset.sort;
+            state.sort = state.sort === key ? '-' + key : key;
+            state.offset = 0;
+            headers.forEach(h => h.classList.remove('asc', 'desc'));
+            this.classList.add(state.sort.startsWith('-') ? 'desc' : 'asc');
+            load();
+        });
+    });
+
+    filterInput.addEventListener('input', function() {
+        clearTimeout(filterTimer);
+        filterTimer = setTimeout(() => {
+            state.filter = this.value.trim();
+            state.offset = 0;
+            load();
+        }, 300);
+    });
+
+    prevBtn.addEventListener('click', function() {
+        state.offset = Math.max(state.offset - pageSize, 0);
+        load();
+    });
+
+    nextBtn.addEventListener('click', function() {
+        if (state.offset + pageSize < state.total) {
+            state.offset += pageSize;
+            load();
+        }
+    });
+
+    load();
+});